@@ -1,7 +1,11 @@
-import asyncio
-from typing import Any, Dict, Optional, List
+import json
+import time
+from typing import Any, Callable, Dict, Optional
 import logging
-from google import genai
+
+from deadline import Deadline, DeadlineExceeded
+from llm_gateway import GeminiBackend, LLMGateway
+from model_router import ModelRouter
 
 logger = logging.getLogger(__name__)
 
@@ -9,11 +13,44 @@ class ActionLayer:
     def __init__(self):
         self.timeout_seconds = 30
         self.client = None
+        self.client_factory: Optional[Callable[[], Any]] = None
+        self.gateway: Optional[LLMGateway] = None
+        self.router = ModelRouter(["gemini-2.0-flash"])
 
     def set_llm_client(self, client: Any) -> None:
         """Set the LLM client (Gemini)"""
         self.client = client
 
+    def set_llm_client_factory(self, factory: Callable[[], Any]) -> None:
+        """Set a factory that builds the LLM client on first use"""
+        self.client_factory = factory
+
+    def get_llm_client(self) -> Any:
+        """Get the LLM client, building it lazily from the factory if needed"""
+        if self.client is None and self.client_factory is not None:
+            self.client = self.client_factory()
+        return self.client
+
+    def set_llm_gateway(self, gateway: LLMGateway) -> None:
+        """Set the gateway (rate limiting, retries, hedging) used for LLM calls"""
+        self.gateway = gateway
+
+    def get_llm_gateway(self) -> LLMGateway:
+        """Get the LLM gateway, creating a default Gemini gateway if none was set"""
+        if self.gateway is None:
+            self.gateway = LLMGateway(GeminiBackend(self.get_llm_client))
+        return self.gateway
+
+    def set_model_router(self, router: ModelRouter) -> None:
+        """Set the router that picks a model for each LLM turn"""
+        self.router = router
+
+    def report_outcome(self, memory_layer: Any, ok: bool) -> None:
+        """Report whether the request's last LLM response was usable, to steer future routing"""
+        model = memory_layer.get_last_model()
+        if model:
+            self.router.record_outcome(model, ok)
+
     async def execute_action(
         self,
         action_type: str,
@@ -29,12 +66,13 @@ class ActionLayer:
         elif action_type == "final_answer":
             return action_params["response"]
         elif action_type == "retry":
-            return await self._generate_retry(memory_layer)
+            # Regenerating from the same prompt would likely repeat the mistake; the
+            # correction goes into the history and the next turn is escalated instead
+            return "Invalid response format. Reply with exactly one FUNCTION_CALL: or FINAL_ANSWER: line."
         elif action_type == "error":
             return f"Error: {action_params.get('message', 'Unknown error')}"
         elif action_type == "finish":
-            responses = memory_layer.get_iteration_responses()
-            return "Reached maximum iterations. History:\n" + "\n".join(responses)
+            return "Reached maximum iterations. History:\n" + memory_layer.render_history()
         else:
             return f"Unknown action type: {action_type}"
 
@@ -51,6 +89,7 @@ class ActionLayer:
         try:
             # Parse the parameters
             params = await perception_layer.parse_function_call_params(param_parts)
+            action_params["params"] = params
             
             # Get the session and tools
             session = memory_layer.get_mcp_session()
@@ -64,55 +103,87 @@ class ActionLayer:
             if not tool:
                 return f"Unknown function: {function_name}"
 
-            # Execute the tool
-            result = await session.call_tool(function_name, params)
-            
-            # Handle the result based on its structure
-            if hasattr(result, 'content'):
-                if isinstance(result.content, list):
-                    # Handle list of content items
-                    content_texts = []
-                    for item in result.content:
-                        if hasattr(item, 'text'):
-                            content_texts.append(item.text)
-                        else:
-                            content_texts.append(str(item))
-                    return str(content_texts)
-                elif hasattr(result.content, 'text'):
-                    # Handle single content item
-                    return result.content.text
-                else:
-                    # Handle raw content
-                    return str(result.content)
+            # Execute the tool within the request deadline
+            deadline = memory_layer.get_deadline()
+            if deadline:
+                result = await deadline.run(session.call_tool(function_name, params))
             else:
-                # Handle raw result
-                return str(result)
+                result = await session.call_tool(function_name, params)
+            success, text = perception_layer.parse_tool_result(result)
+            return text if success else f"Error executing function {function_name}: {text}"
             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             # logger.error(f"Error executing function {function_name}: {str(e)}")
             return f"Error executing function {function_name}: {str(e)}"
 
-    async def _generate_retry(self, memory_layer: Any) -> str:
-        """Generate a new response using the LLM"""
-        if not self.client:
-            raise ValueError("LLM client not initialized")
-            
+    async def read_large_result(
+        self,
+        session: Any,
+        handle: str,
+        deadline: Optional[Deadline] = None,
+        chunk_chars: int = 65536
+    ) -> str:
+        """Read a large result stored server-side by its result:// handle, chunk by chunk"""
+        async def read(uri: str) -> str:
+            if deadline:
+                result = await deadline.run(session.read_resource(uri))
+            else:
+                result = await session.read_resource(uri)
+            return result.contents[0].text
+
+        info = json.loads(await read(handle))
+        chunks = []
+        for offset in range(0, info["size"], chunk_chars):
+            chunks.append(await read(f"{handle}/{offset}/{chunk_chars}"))
+        return "".join(chunks)
+
+    async def generate_content(
+        self,
+        contents: Any,
+        config: Any = None,
+        deadline: Optional[Deadline] = None,
+        escalate: bool = False,
+        memory_layer: Any = None
+    ) -> Any:
+        """
+        Call the LLM through the gateway and return the raw response.
+        The model router picks a fast model, or a stronger one when `escalate` is set;
+        the choice is recorded on the request's `memory_layer` for report_outcome.
+        Each attempt is capped at timeout_seconds and the whole call by the request deadline.
+        Raises LLMError (or DeadlineExceeded) on failure.
+        """
+        model = self.router.choose(escalate)
+        if memory_layer is not None:
+            memory_layer.set_last_model(model)
+        started = time.monotonic()
         try:
-            prompt = memory_layer.get_system_prompt()
-            
-            async def generate():
-                response = self.client.models.generate_content(
-                    model="gemini-2.0-flash",
-                    contents=prompt
-                )
-                return response.text.strip()
-
-            # Use asyncio.wait_for to implement timeout
-            result = await asyncio.wait_for(generate(), timeout=self.timeout_seconds)
-            return result
-            
-        except asyncio.TimeoutError:
-            return "Error: LLM generation timed out"
-        except Exception as e:
-            logger.error(f"Error in LLM generation: {str(e)}")
-            return f"Error in LLM generation: {str(e)}"
\ No newline at end of file
+            response = await self.get_llm_gateway().generate(
+                model,
+                contents,
+                config=config,
+                timeout=self.timeout_seconds,
+                deadline=deadline
+            )
+        except Exception:
+            self.router.record_call(model, time.monotonic() - started, False)
+            raise
+        self.router.record_call(model, time.monotonic() - started, True)
+        return response
+
+    async def generate(
+        self,
+        prompt: str,
+        deadline: Optional[Deadline] = None,
+        escalate: bool = False,
+        memory_layer: Any = None
+    ) -> str:
+        """Generate a text response for the given prompt"""
+        response = await self.generate_content(prompt, deadline=deadline, escalate=escalate, memory_layer=memory_layer)
+        return (response.text or "").strip()
+
+    async def _generate_retry(self, memory_layer: Any, escalate: bool = False) -> str:
+        """Generate a new response using the LLM"""
+        prompt = memory_layer.get_current_prompt() or memory_layer.get_system_prompt()
+        return await self.generate(prompt, memory_layer.get_deadline(), escalate, memory_layer)
\ No newline at end of file
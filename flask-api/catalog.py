@@ -0,0 +1,199 @@
+import hashlib
+import json
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token for English and code)"""
+    return (len(text) + 3) // 4
+
+def resolve_schema(schema: Any, defs: Optional[Dict[str, Any]] = None) -> Any:
+    """Inline local `$ref`s (e.g. #/$defs/MathInput) so nested fields are visible"""
+    if defs is None and isinstance(schema, dict):
+        defs = schema.get("$defs", schema.get("definitions", {}))
+    if isinstance(schema, dict):
+        ref = schema.get("$ref")
+        if isinstance(ref, str) and ref.startswith("#/"):
+            target = defs.get(ref.rsplit("/", 1)[-1], {})
+            merged = {**target, **{k: v for k, v in schema.items() if k != "$ref"}}
+            return resolve_schema(merged, defs)
+        return {
+            k: resolve_schema(v, defs)
+            for k, v in schema.items() if k not in ("$defs", "definitions")
+        }
+    if isinstance(schema, list):
+        return [resolve_schema(item, defs) for item in schema]
+    return schema
+
+def render_type(schema: Dict[str, Any]) -> str:
+    """Render a (resolved) JSON schema as a compact type expression"""
+    for key in ("anyOf", "oneOf"):
+        if key in schema:
+            options = [render_type(option) for option in schema[key]]
+            return "|".join(dict.fromkeys(o for o in options if o != "null"))
+    schema_type = schema.get("type", "any")
+    if schema_type == "array":
+        if "prefixItems" in schema:
+            return "[" + ", ".join(render_type(item) for item in schema["prefixItems"]) + "][]"
+        return render_type(schema.get("items", {})) + "[]"
+    if schema_type == "object" and "properties" in schema:
+        return "{" + ", ".join(f"{name}: {render_type(prop)}" for name, prop in schema["properties"].items()) + "}"
+    return schema_type
+
+def flatten_params(schema: Dict[str, Any], prefix: str = "") -> List[Tuple[str, str, bool]]:
+    """
+    Flatten nested object parameters into dotted paths.
+    Returns: [(path, type, required)], e.g. [("input.a", "number", True), ...]
+    """
+    params = []
+    required = set(schema.get("required", []))
+    for name, prop in schema.get("properties", {}).items():
+        path = f"{prefix}{name}"
+        if prop.get("type") == "object" and "properties" in prop:
+            params.extend(flatten_params(prop, f"{path}."))
+        else:
+            params.append((path, render_type(prop), name in required))
+    return params
+
+def accepts_handle(schema: Dict[str, Any]) -> bool:
+    """Whether a (resolved) parameter schema accepts a result:// handle string"""
+    options = schema.get("anyOf", schema.get("oneOf", [schema]))
+    return any(
+        option.get("type") == "string" and "result://" in option.get("pattern", "")
+        for option in options
+    )
+
+def handle_params(tool: Any) -> Set[str]:
+    """Dotted parameter paths of a tool that accept a result:// handle, e.g. {"input.l"}"""
+    paths = set()
+
+    def walk(schema: Dict[str, Any], prefix: str) -> None:
+        for name, prop in schema.get("properties", {}).items():
+            if prop.get("type") == "object" and "properties" in prop:
+                walk(prop, f"{prefix}{name}.")
+            elif accepts_handle(prop):
+                paths.add(f"{prefix}{name}")
+
+    walk(resolve_schema(getattr(tool, 'inputSchema', None) or {}), "")
+    return paths
+
+def render_signature(tool: Any) -> str:
+    """Render one tool as `name(input.a: number, input.b: number): description`"""
+    schema = resolve_schema(getattr(tool, 'inputSchema', None) or {})
+    params = ", ".join(
+        f"{path}: {param_type}" if required else f"{path}?: {param_type}"
+        for path, param_type, required in flatten_params(schema)
+    )
+    desc = (getattr(tool, 'description', None) or "").strip().splitlines()
+    signature = f"{getattr(tool, 'name', '')}({params})"
+    return f"{signature}: {desc[0]}" if desc else signature
+
+# Schema keywords supported by Gemini function declarations (an OpenAPI subset)
+DECLARATION_SCHEMA_KEYS = {"type", "description", "properties", "required", "items", "enum", "format", "nullable", "anyOf", "minItems", "maxItems"}
+
+def to_declaration_schema(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a resolved JSON schema into the subset accepted for function declarations"""
+    schema = dict(schema)
+    if "prefixItems" in schema:
+        # Tuples become arrays whose items may be any of the tuple member types
+        members = [to_declaration_schema(item) for item in schema.pop("prefixItems")]
+        schema["items"] = members[0] if len(members) == 1 else {"anyOf": members}
+    result = {}
+    for key, value in schema.items():
+        if key not in DECLARATION_SCHEMA_KEYS:
+            continue
+        if key == "type" and isinstance(value, str):
+            result[key] = value.upper()
+        elif key == "properties":
+            result[key] = {name: to_declaration_schema(prop) for name, prop in value.items()}
+        elif key == "items":
+            result[key] = to_declaration_schema(value)
+        elif key == "anyOf":
+            result[key] = [to_declaration_schema(option) for option in value]
+        else:
+            result[key] = value
+    return result
+
+def to_function_declaration(tool: Any) -> Dict[str, Any]:
+    """Convert an MCP tool into a native function declaration for the LLM"""
+    schema = resolve_schema(getattr(tool, 'inputSchema', None) or {})
+    declaration = {
+        "name": getattr(tool, 'name', ''),
+        "description": (getattr(tool, 'description', None) or "").strip(),
+    }
+    if schema.get("properties"):
+        declaration["parameters"] = to_declaration_schema(schema)
+    return declaration
+
+class ToolCatalog:
+    """
+    Renders prompt prefixes containing the tool list as a minimal signature
+    list. The rendered prefix is cached by a hash of the tool names,
+    descriptions and schemas (plus the template), so it is only rebuilt when
+    the tools change.
+    """
+    def __init__(self, max_entries: int = 16):
+        self.max_entries = max_entries
+        self.cache: Dict[str, str] = {}
+        self.declarations_cache: Dict[str, List[Dict[str, Any]]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.catalog_tokens = 0
+        self.prompt_tokens = 0
+
+    def fingerprint(self, tools: Iterable[Any], exclude: Iterable[str] = (), template: str = "") -> str:
+        """Hash of everything that affects the rendered prefix"""
+        payload = [
+            [getattr(t, 'name', ''), getattr(t, 'description', ''), getattr(t, 'inputSchema', None)]
+            for t in tools
+        ]
+        raw = json.dumps([payload, sorted(exclude), template], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def render_catalog(self, tools: Iterable[Any], exclude: Iterable[str] = ()) -> str:
+        """Render the tools as one signature per line"""
+        excluded = set(exclude)
+        return "\n".join(
+            f"- {render_signature(tool)}" for tool in tools
+            if getattr(tool, 'name', '') not in excluded
+        )
+
+    def render(self, tools: Iterable[Any], exclude: Iterable[str] = (), template: str = "{catalog}") -> str:
+        """Render `template` with the tool catalog, reusing the cached text when nothing changed"""
+        tools = list(tools)
+        key = self.fingerprint(tools, exclude, template)
+        rendered = self.cache.get(key)
+        if rendered is not None:
+            self.hits += 1
+            return rendered
+
+        self.misses += 1
+        catalog = self.render_catalog(tools, exclude)
+        rendered = template.format(catalog=catalog)
+        self.catalog_tokens = estimate_tokens(catalog)
+        self.prompt_tokens = estimate_tokens(rendered)
+        if len(self.cache) >= self.max_entries:
+            self.cache.pop(next(iter(self.cache)))
+        self.cache[key] = rendered
+        return rendered
+
+    def function_declarations(self, tools: Iterable[Any], exclude: Iterable[str] = ()) -> List[Dict[str, Any]]:
+        """Native function declarations for the tools, cached like the rendered catalog"""
+        tools = list(tools)
+        key = "declarations:" + self.fingerprint(tools, exclude)
+        declarations = self.declarations_cache.get(key)
+        if declarations is None:
+            excluded = set(exclude)
+            declarations = [to_function_declaration(t) for t in tools if getattr(t, 'name', '') not in excluded]
+            if len(self.declarations_cache) >= self.max_entries:
+                self.declarations_cache.pop(next(iter(self.declarations_cache)))
+            self.declarations_cache[key] = declarations
+        return declarations
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache counters and estimated token counts of the last rendered prefix"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "catalog_tokens": self.catalog_tokens,
+            "prompt_tokens": self.prompt_tokens,
+        }
@@ -0,0 +1,117 @@
+import ast
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from safe_eval import safe_eval
+
+# Step lists at least this long are compared in one vectorized NumPy batch
+VECTORIZE_THRESHOLD = 64
+TOLERANCE = 1e-10
+
+def normalize_expression(expression: str) -> str:
+    """Normalize an expression so equivalent spellings share a cache entry"""
+    return "".join(expression.split()).replace("^", "**")
+
+def numeric_literals(expression: str) -> List[float]:
+    """Numbers written literally in an expression (used to detect reused step results)"""
+    try:
+        tree = ast.parse(expression, mode="eval")
+    except SyntaxError:
+        return []
+    return [
+        float(node.value) for node in ast.walk(tree)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool)
+    ]
+
+class ConsistencyEngine:
+    """
+    Incremental checker for calculation steps within one MCP session.
+    The value of every expression is computed once and remembered (keyed by
+    its normalized form), so re-checking a growing step list only evaluates
+    the new steps. Results are compared in a vectorized batch for long lists,
+    and steps that reuse earlier results are linked so wrong results that
+    propagate are reported.
+    """
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        # normalized expression -> computed value (None if it couldn't be evaluated)
+        self.values: "OrderedDict[str, Optional[float]]" = OrderedDict()
+
+    def evaluate(self, expression: str) -> Tuple[Optional[float], bool]:
+        """
+        Get the value of an expression, computing it only if unseen.
+        Returns: (value, was_cached)
+        """
+        key = normalize_expression(expression)
+        if key in self.values:
+            self.values.move_to_end(key)
+            return self.values[key], True
+        try:
+            value = float(safe_eval(key))
+        except Exception:
+            value = None
+        self.values[key] = value
+        if len(self.values) > self.max_entries:
+            self.values.popitem(last=False)
+        return value, False
+
+    def compare(self, expected: Sequence[Optional[float]], claimed: Sequence[float]) -> List[Optional[bool]]:
+        """Compare computed and claimed results; None where the step couldn't be evaluated"""
+        if len(claimed) >= VECTORIZE_THRESHOLD:
+            import numpy as np
+            expected_arr = np.array([np.nan if v is None else v for v in expected], dtype=float)
+            claimed_arr = np.asarray(claimed, dtype=float)
+            with np.errstate(invalid="ignore"):
+                matches = np.abs(expected_arr - claimed_arr) < TOLERANCE
+            unknown = np.isnan(expected_arr)
+            return [None if u else bool(m) for u, m in zip(unknown.tolist(), matches.tolist())]
+        return [
+            None if e is None else abs(e - float(c)) < TOLERANCE
+            for e, c in zip(expected, claimed)
+        ]
+
+    def check(self, steps: Sequence[Tuple[str, float]]) -> Dict[str, Any]:
+        """Check a list of (expression, result) steps for correctness and consistency"""
+        issues = []
+        warnings = []
+        insights = []
+
+        evaluated = [self.evaluate(expression) for expression, _ in steps]
+        expected = [value for value, _ in evaluated]
+        reused = sum(cached for _, cached in evaluated)
+        matches = self.compare(expected, [result for _, result in steps])
+
+        # Most recent step that produced each result value, to find steps that reuse them.
+        # Links are inferred from matching values, so they are reported but not scored.
+        earlier: Dict[float, int] = {}
+        for i, ((expression, result), match) in enumerate(zip(steps, matches), 1):
+            if match is None:
+                warnings.append(f"Step {i}: Couldn't verify calculation")
+            elif not match:
+                issues.append(f"Step {i}: Calculation mismatch")
+
+            sources = sorted({
+                earlier[key] for key in (
+                    round(literal, 9) for literal in numeric_literals(normalize_expression(expression))
+                ) if key in earlier
+            })
+            for source in sources:
+                if matches[source - 1] is False:
+                    insights.append(f"Step {i} uses the result of step {source}, which is incorrect")
+                else:
+                    insights.append(f"Step {i} uses the result of step {source}")
+
+            earlier[round(float(result), 9)] = i
+
+        total_checks = len(steps) * 5
+        passed_checks = max(0, total_checks - (len(issues) * 2 + len(warnings)))
+        consistency_score = (passed_checks / total_checks) * 100 if total_checks else 100.0
+
+        return {
+            "consistency_score": consistency_score,
+            "issues": issues,
+            "warnings": warnings,
+            "insights": insights,
+            "steps_checked": len(steps) - reused,
+            "steps_reused": reused,
+        }
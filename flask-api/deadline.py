@@ -0,0 +1,50 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Optional
+
+class DeadlineExceeded(Exception):
+    """Raised when a request runs out of time"""
+
+class Deadline:
+    """
+    Absolute per-request deadline.
+    Every LLM call and MCP tool call is bounded by the time that is left, so a
+    request never runs past its budget.
+    """
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline (never negative)"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        """Check if the deadline has passed"""
+        return time.monotonic() >= self.expires_at
+
+    def timeout(self, cap: Optional[float] = None) -> float:
+        """Timeout for the next operation: the time left, optionally capped"""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Request deadline of {self.seconds:.1f}s exceeded")
+        return remaining if cap is None else min(cap, remaining)
+
+    async def run(self, awaitable: Awaitable[Any], cap: Optional[float] = None) -> Any:
+        """
+        Await an operation within the deadline (and the optional per-call cap).
+        Raises DeadlineExceeded if the request deadline expires first, or
+        asyncio.TimeoutError if only the per-call cap was hit.
+        """
+        try:
+            timeout = self.timeout(cap)
+        except DeadlineExceeded:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise
+        try:
+            return await asyncio.wait_for(awaitable, timeout=timeout)
+        except asyncio.TimeoutError:
+            if self.expired():
+                raise DeadlineExceeded(f"Request deadline of {self.seconds:.1f}s exceeded")
+            raise
@@ -1,9 +1,91 @@
+import ast
 import asyncio
+import math
+import re
 from typing import Dict, Any, Tuple, Optional
 
+from safe_eval import safe_eval, is_close
+
+# Expressions that recompute each tool's result for local verification.
+# Operands are parenthesized so negative values keep their sign (e.g. (-2) ** (2)).
+TOOL_EXPRESSIONS = {
+    "add": "({a}) + ({b})",
+    "subtract": "({a}) - ({b})",
+    "multiply": "({a}) * ({b})",
+    "divide": "({a}) / ({b})",
+    "power": "({a}) ** ({b})",
+    "remainder": "({a}) % ({b})",
+    "mine": "({a}) - ({b}) - ({b})",
+    "sqrt": "sqrt({a})",
+    "cbrt": "cbrt({a})",
+    "factorial": "factorial({a})",
+    "log": "log({a})",
+    "sin": "sin({a})",
+    "cos": "cos({a})",
+    "tan": "tan({a})",
+}
+
+# Verification tools the client replaces with local checks
+LOCAL_VERIFICATION_TOOLS = {"verify_calculation", "verify_consistency"}
+
+def _parse_literal(text: Any) -> Any:
+    """Parse a tool result or answer string as a Python literal"""
+    return ast.literal_eval(str(text).strip())
+
+def _is_rounded(actual: Any, expected: Any, decimal_places: Optional[int]) -> bool:
+    """Check if `actual` is `expected` rounded to `decimal_places`"""
+    if decimal_places is None:
+        return False
+    try:
+        return abs(float(actual) - float(expected)) <= 0.5 * 10 ** -int(decimal_places) + 1e-9
+    except (TypeError, ValueError, OverflowError):
+        return False
+
+def _fibonacci(n: int) -> list:
+    sequence = [0, 1]
+    for _ in range(2, n):
+        sequence.append(sequence[-1] + sequence[-2])
+    return sequence[:max(n, 0)]
+
+# Tools whose results are recomputed directly from their input
+TOOL_FUNCTIONS = {
+    "add_list": lambda i: sum(i["l"]),
+    "int_list_to_exponential_sum": lambda i: sum(math.exp(x) for x in i["l"]),
+    "strings_to_chars_to_int": lambda i: [ord(c) for c in i["string"]],
+    "fibonacci_numbers": lambda i: _fibonacci(int(i["a"])),
+}
+
 class DecisionLayer:
-    def __init__(self):
-        pass
+    def __init__(self, min_iterations: int = 4, max_iterations: int = 20, escalation_threshold: int = 1):
+        self.min_iterations = min_iterations
+        self.max_iterations = max_iterations
+        self.escalation_threshold = escalation_threshold
+
+    def should_escalate(self, memory_layer: Any) -> bool:
+        """Use a stronger model after parse failures, failed verifications or retries"""
+        return memory_layer.get_consecutive_failures() >= self.escalation_threshold
+
+    def estimate_iteration_budget(self, expression: str) -> int:
+        """
+        Estimate how many iterations an expression needs: roughly one tool call per
+        operation, plus the reasoning and final-answer turns and some slack for retries.
+        """
+        try:
+            tree = ast.parse(expression.strip().replace("^", "**"), mode="eval")
+            operations = sum(
+                isinstance(node, (ast.BinOp, ast.Call))
+                or (isinstance(node, ast.UnaryOp) and not isinstance(node.operand, ast.Constant))
+                for node in ast.walk(tree)
+            )
+        except (SyntaxError, ValueError):
+            # Free-text queries: count operators and function-like words, but allow
+            # at least half the maximum since the amount of work is uncertain
+            operations = len(re.findall(r"[-+*/^%]|\b[a-zA-Z_]+\s*\(", expression))
+            budget = operations + 2 + (operations + 1) // 2
+            return max(self.max_iterations // 2, min(self.max_iterations, budget))
+
+        budget = operations + 2 + (operations + 1) // 2
+        return max(self.min_iterations, min(self.max_iterations, budget))
 
     async def determine_next_action(
         self,
@@ -20,9 +102,6 @@ class DecisionLayer:
         if not memory_layer.should_continue():
             return "finish", None
 
-        # Store the response for history
-        memory_layer.add_iteration_response(raw_response)
-        
         # If it's a function call, prepare the parameters for action
         if response_type == "function_call":
             if len(function_parts) < 1:
@@ -44,6 +123,81 @@ class DecisionLayer:
         else:
             return "retry", None
 
+    def verify_tool_result(
+        self,
+        function_name: str,
+        params: Optional[Dict[str, Any]],
+        result: str
+    ) -> Optional[str]:
+        """
+        Verify a tool result locally by recomputing it with the safe evaluator.
+        Returns a verdict to feed into the next observation, or None if the tool cannot be checked.
+        """
+        tool_input = (params or {}).get("input")
+        if not isinstance(tool_input, dict):
+            return None
+
+        try:
+            if function_name in TOOL_EXPRESSIONS:
+                expression = TOOL_EXPRESSIONS[function_name].format(**tool_input)
+                expected = safe_eval(expression)
+            elif function_name in TOOL_FUNCTIONS:
+                expression = f"{function_name}({tool_input})"
+                expected = TOOL_FUNCTIONS[function_name](tool_input)
+            else:
+                return None
+            actual = _parse_literal(result)
+        except Exception:
+            return None
+
+        if is_close(actual, expected):
+            return f"Verified: {expression} = {result}"
+        return f"Verification FAILED: {expression} should be {expected}, tool returned {result}"
+
+    def verify_final_answer(
+        self,
+        expression: str,
+        answer: str,
+        decimal_places: Optional[int] = None
+    ) -> Tuple[bool, Optional[str]]:
+        """
+        Check a final answer against the original expression when it can be evaluated locally.
+        Answers rounded to the user's preferred `decimal_places` are accepted.
+        Returns: (is_consistent, verdict)
+        """
+        try:
+            expected = safe_eval(expression)
+        except Exception:
+            # Not a plain arithmetic expression; rely on the per-step verification
+            return True, None
+
+        try:
+            actual = _parse_literal(answer)
+        except Exception:
+            actual = None
+
+        if is_close(actual, expected, tolerance=1e-6) or _is_rounded(actual, expected, decimal_places):
+            return True, f"Verified: final answer {answer}"
+        return False, f"Verification FAILED: final answer {answer} does not match {expression}. Re-check your steps."
+
+    async def verify_final_answer_async(
+        self,
+        expression: str,
+        answer: str,
+        decimal_places: Optional[int] = None,
+        deadline: Any = None
+    ) -> Tuple[bool, Optional[str]]:
+        """
+        Run verify_final_answer in a worker thread, bounded by the request deadline.
+        Evaluating the user's expression is CPU work that would otherwise block the shared event loop.
+        """
+        check = asyncio.get_running_loop().run_in_executor(
+            None, self.verify_final_answer, expression, answer, decimal_places
+        )
+        if deadline:
+            return await deadline.run(check)
+        return await check
+
     def check_prerequisites(self, memory_layer: Any) -> Tuple[bool, Optional[str]]:
         """
         Check if all prerequisites are met before processing
@@ -0,0 +1,111 @@
+"""
+Import-time profile report for the Flask API and the MCP tool server.
+
+Runs each module in a fresh interpreter with `-X importtime` and prints the
+slowest imports, so cold-start regressions are easy to spot.
+
+Usage:
+    python import_profile.py                 # profile mcp_client and mcp_server
+    python import_profile.py mcp_server --top 15
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from typing import List, Tuple
+
+DEFAULT_MODULES = ["mcp_client", "mcp_server"]
+
+def profile_imports(module: str, cwd: str) -> Tuple[List[Tuple[int, int, str]], float, str]:
+    """
+    Import a module in a fresh interpreter with -X importtime.
+    Returns: (rows of (self_us, cumulative_us, name), wall_seconds, error_output)
+    """
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd,
+        capture_output=True,
+        text=True
+    )
+    wall_seconds = time.perf_counter() - started
+
+    rows = []
+    errors = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            errors.append(line)
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            self_us = int(parts[0])
+            cumulative_us = int(parts[1])
+        except ValueError:
+            # Header line
+            continue
+        rows.append((self_us, cumulative_us, parts[2].rstrip()))
+
+    error_output = "\n".join(errors) if proc.returncode != 0 else ""
+    return rows, wall_seconds, error_output
+
+def import_depth(name: str) -> int:
+    """Nesting level of an -X importtime row (two spaces of indent per level)"""
+    return (len(name) - len(name.lstrip()) - 1) // 2
+
+def module_subtree(module: str, rows: List[Tuple[int, int, str]]) -> List[Tuple[int, int, str]]:
+    """
+    Rows imported while importing `module`, including its own row.
+    -X importtime lists a module after everything it imports, so these are the
+    rows between the previous top-level row and the module's own row.
+    """
+    subtree: List[Tuple[int, int, str]] = []
+    for row in rows:
+        subtree.append(row)
+        if import_depth(row[2]) == 0:
+            if row[2].strip() == module:
+                return subtree
+            subtree = []
+    return []
+
+def format_report(module: str, rows: List[Tuple[int, int, str]], wall_seconds: float, top: int) -> str:
+    """Format the import-time rows of one module as a text report"""
+    total_us = sum(self_us for self_us, _, _ in rows)
+    lines = [
+        f"== {module} ==",
+        f"wall time: {wall_seconds * 1000:.1f} ms, imports: {len(rows)}, "
+        f"total import time: {total_us / 1000:.1f} ms",
+        "",
+        f"Direct imports of {module}:",
+        f"{'cumulative ms':>14} {'self ms':>9}  package"
+    ]
+    subtree = module_subtree(module, rows)
+    direct = [row for row in subtree if import_depth(row[2]) == 1]
+    for self_us, cumulative_us, name in sorted(direct, key=lambda r: r[1], reverse=True)[:top]:
+        lines.append(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name.strip()}")
+    lines += ["", f"Slowest imports under {module} by self time:", f"{'self ms':>14} {'cumulative ms':>14}  module"]
+    for self_us, cumulative_us, name in sorted(subtree, key=lambda r: r[0], reverse=True)[:top]:
+        lines.append(f"{self_us / 1000:>14.1f} {cumulative_us / 1000:>14.1f}  {name.strip()}")
+    return "\n".join(lines)
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Import-time profile report")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES, help="Modules to profile")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to show")
+    args = parser.parse_args()
+
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    status = 0
+    for module in args.modules:
+        rows, wall_seconds, error_output = profile_imports(module, cwd)
+        print(format_report(module, rows, wall_seconds, args.top))
+        if error_output:
+            print(f"Import of {module} failed:\n{error_output}")
+            status = 1
+        print()
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,280 @@
+"""
+Client-side gateway for LLM calls: token-bucket rate limiting, a concurrency
+cap, jittered exponential retries on retryable errors and optional hedged
+requests for tail latency.
+
+Run `python llm_gateway.py` to exercise the gateway against FakeLLMBackend,
+a local fake endpoint that injects latency and 429s.
+"""
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from types import SimpleNamespace
+from typing import Any, Callable, Deque, Dict, Optional
+
+from deadline import Deadline, DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+class LLMError(Exception):
+    """An LLM call failed"""
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+class LLMUnavailableError(LLMError):
+    """An LLM call kept failing after all retries"""
+
+def error_status(exc: BaseException) -> Optional[int]:
+    """Extract an HTTP status code from a provider exception, if any"""
+    for attr in ("status", "code", "status_code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+def is_retryable(exc: BaseException) -> bool:
+    """Rate limits, server errors, timeouts and connection problems are worth retrying"""
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    return error_status(exc) in RETRYABLE_STATUS_CODES
+
+class TokenBucket:
+    """Token-bucket rate limiter: `rate` requests per second with bursts of up to `burst`"""
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.lock: Optional[asyncio.Lock] = None
+
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it"""
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class LatencyTracker:
+    """Sliding window of recent call latencies"""
+    def __init__(self, window: int = 200):
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+class GeminiBackend:
+    """Calls Gemini through the async google-genai client"""
+    def __init__(self, get_client: Callable[[], Any]):
+        self.get_client = get_client
+
+    async def generate(self, model: str, contents: Any, config: Any = None) -> Any:
+        client = self.get_client()
+        if not client:
+            raise ValueError("LLM client not initialized")
+        return await client.aio.models.generate_content(model=model, contents=contents, config=config)
+
+class FakeLLMBackend:
+    """
+    Local fake LLM endpoint for exercising the gateway.
+    Every call sleeps for a random latency (with an occasional slow tail) and
+    fails with a 429 at the given rate.
+    """
+    def __init__(
+        self,
+        reply: Callable[[str, Any], str] = lambda model, contents: "FINAL_ANSWER: 0",
+        latency: float = 0.05,
+        tail_latency: float = 1.0,
+        tail_rate: float = 0.05,
+        rate_limit_rate: float = 0.2,
+        seed: Optional[int] = None
+    ):
+        self.reply = reply
+        self.latency = latency
+        self.tail_latency = tail_latency
+        self.tail_rate = tail_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+
+    async def generate(self, model: str, contents: Any, config: Any = None) -> Any:
+        self.calls += 1
+        slow = self.random.random() < self.tail_rate
+        await asyncio.sleep(self.tail_latency if slow else self.random.uniform(0.5, 1.5) * self.latency)
+        if self.random.random() < self.rate_limit_rate:
+            raise LLMError("429 RESOURCE_EXHAUSTED (injected)", status=429)
+        return SimpleNamespace(text=self.reply(model, contents), function_calls=None)
+
+class LLMGateway:
+    def __init__(
+        self,
+        backend: Any,
+        rate_per_second: float = 5.0,
+        burst: int = 10,
+        max_concurrency: int = 4,
+        max_retries: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        hedge: bool = False,
+        hedge_percentile: float = 95.0,
+        hedge_min_samples: int = 20
+    ):
+        self.backend = backend
+        self.rate_limiter = TokenBucket(rate_per_second, burst)
+        self.max_concurrency = max_concurrency
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.latency = LatencyTracker()
+        self.counters = {"calls": 0, "attempts": 0, "retries": 0, "rate_limited": 0, "hedged": 0, "hedge_wins": 0, "failures": 0}
+
+    async def generate(
+        self,
+        model: str,
+        contents: Any,
+        config: Any = None,
+        timeout: Optional[float] = None,
+        deadline: Optional[Deadline] = None
+    ) -> Any:
+        """
+        Generate a response, retrying retryable errors with jittered exponential backoff.
+        Raises LLMUnavailableError when retries are exhausted, LLMError for other failures
+        and DeadlineExceeded when the request deadline expires.
+        """
+        self.counters["calls"] += 1
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await self._hedged_attempt(model, contents, config, timeout, deadline)
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    self.counters["failures"] += 1
+                    raise LLMError(f"LLM call failed: {e}", error_status(e)) from e
+                if error_status(e) == 429:
+                    self.counters["rate_limited"] += 1
+                if attempt == self.max_retries:
+                    self.counters["failures"] += 1
+                    raise LLMUnavailableError(
+                        f"LLM call failed after {attempt + 1} attempts: {e}", error_status(e)
+                    ) from e
+
+                # Full jitter, never sleeping past the deadline
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                if deadline:
+                    delay = min(delay, deadline.remaining())
+                logger.warning(f"Retryable LLM error ({e}); retry {attempt + 1} in {delay:.2f}s")
+                self.counters["retries"] += 1
+                await asyncio.sleep(delay)
+
+    async def _attempt(self, model: str, contents: Any, config: Any, timeout: Optional[float], deadline: Optional[Deadline]) -> Any:
+        """
+        One rate-limited, concurrency-capped call to the backend.
+        The per-call `timeout` only covers the backend call; waiting for a rate
+        limit token or a concurrency slot is bounded by the request deadline alone.
+        """
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def backend_call():
+            self.counters["attempts"] += 1
+            started = time.monotonic()
+            response = await self.backend.generate(model, contents, config)
+            self.latency.record(time.monotonic() - started)
+            return response
+
+        async def call():
+            await self.rate_limiter.acquire()
+            async with self.semaphore:
+                if deadline:
+                    return await deadline.run(backend_call(), cap=timeout)
+                if timeout:
+                    return await asyncio.wait_for(backend_call(), timeout=timeout)
+                return await backend_call()
+
+        if deadline:
+            return await deadline.run(call())
+        return await call()
+
+    async def _hedged_attempt(self, model: str, contents: Any, config: Any, timeout: Optional[float], deadline: Optional[Deadline]) -> Any:
+        """
+        Send the request and, if it is slower than the recent p95 latency, send a
+        duplicate. The first successful response wins and the other is cancelled.
+        """
+        hedge_delay = self.latency.percentile(self.hedge_percentile)
+        if not self.hedge or hedge_delay is None or len(self.latency.samples) < self.hedge_min_samples:
+            return await self._attempt(model, contents, config, timeout, deadline)
+
+        primary = asyncio.ensure_future(self._attempt(model, contents, config, timeout, deadline))
+        done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+        if done:
+            return primary.result()
+
+        self.counters["hedged"] += 1
+        hedge = asyncio.ensure_future(self._attempt(model, contents, config, timeout, deadline))
+        pending = {primary, hedge}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.counters["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters and latency percentiles for monitoring"""
+        p50, p95 = self.latency.percentile(50), self.latency.percentile(95)
+        return {
+            **self.counters,
+            "latency_p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "latency_p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
+
+async def _demo(requests: int = 100) -> None:
+    gateway = LLMGateway(
+        FakeLLMBackend(seed=0),
+        rate_per_second=50,
+        burst=20,
+        max_concurrency=8,
+        base_delay=0.05,
+        hedge=True
+    )
+    started = time.monotonic()
+    results = await asyncio.gather(
+        *(gateway.generate("fake-model", f"request {i}", timeout=5) for i in range(requests)),
+        return_exceptions=True
+    )
+    failed = sum(isinstance(r, Exception) for r in results)
+    print(f"{requests} requests in {time.monotonic() - started:.2f}s, {failed} failed")
+    print(gateway.stats())
+
+if __name__ == "__main__":
+    asyncio.run(_demo())
@@ -1,17 +1,26 @@
+import hmac
 import os
+import time
+import concurrent.futures
+import threading
+from contextlib import AsyncExitStack
 from dotenv import load_dotenv
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
 import asyncio
-from google import genai
 import logging
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, send_from_directory
 from flask_cors import CORS
 
 from perception import PerceptionLayer
 from memory import MemoryLayer
-from decision import DecisionLayer
+from decision import DecisionLayer, LOCAL_VERIFICATION_TOOLS
 from action import ActionLayer
+from deadline import Deadline, DeadlineExceeded
+from llm_gateway import GeminiBackend, LLMError, LLMGateway
+from model_router import ModelRouter
+from planner import PlanExecutor
+from native_agent import NativeToolAgent
+from catalog import ToolCatalog
+from profiling import Profiler
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -24,100 +33,115 @@ CORS(app)
 # Load environment variables
 load_dotenv()
 
-def get_or_create_event_loop():
+# "lazy": serve HTTP immediately and warm the MCP session in the background.
+# "eager": block until the MCP session is ready before serving.
+STARTUP_MODE = os.getenv("STARTUP_MODE", "lazy").lower()
+
+# "step": ask the LLM for every step. "plan": one LLM call returns a tool-call
+# graph that is executed locally. "native": structured function calling with
+# the tool schemas as function declarations. Can be overridden per request with "mode".
+EXECUTION_MODE = os.getenv("EXECUTION_MODE", "step").lower()
+EXECUTION_MODES = ("step", "plan", "native")
+
+# Server policy for the per-request deadline; clients may ask for less with
+# "deadline_ms" in the body or the X-Request-Deadline-Ms header.
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "60"))
+
+# On-demand profiling is disabled unless an admin token is configured. With a
+# token, a request can opt in with "X-Profile: <token>" and the admin endpoints
+# arm profiling for the next N requests.
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN")
+
+_process_started_at = time.monotonic()
+_startup_lock = threading.RLock()
+_loop = None
+_loop_thread = None
+_warmup_future = None
+_session_lock = None
+_session_stack = None
+_startup_error = None
+
+def get_event_loop():
+    """Get the background event loop that owns the MCP session, starting it if needed"""
+    global _loop, _loop_thread
+    with _startup_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name="mcp-event-loop", daemon=True)
+            _loop_thread.start()
+        return _loop
+
+def run_async(coro, timeout=None):
+    """Run a coroutine on the background event loop and wait for its result"""
+    future = asyncio.run_coroutine_threadsafe(coro, get_event_loop())
     try:
-        return asyncio.get_event_loop()
-    except RuntimeError:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        return loop
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        # Don't leave a stuck request running on the loop
+        future.cancel()
+        raise
 
 # Initialize layers and clients
 memory_layer = MemoryLayer()
 perception_layer = PerceptionLayer()
 decision_layer = DecisionLayer()
 action_layer = ActionLayer()
+tool_catalog = ToolCatalog()
+plan_executor = PlanExecutor(tool_catalog)
+native_agent = NativeToolAgent(tool_catalog)
+api_profiler = Profiler("api")
 
-# Initialize Gemini client and set it in action layer
-api_key = os.getenv("GEMINI_API_KEY")
-client = genai.Client(api_key=api_key)
-action_layer.set_llm_client(client)
+def create_llm_client():
+    """Create the Gemini client (google.genai is imported here to keep startup fast)"""
+    from google import genai
+    return genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
 
-async def create_system_prompt(tools) -> str:
-    """Create system prompt with available tools"""
-    try:
-        tools_description = []
-        for i, tool in enumerate(tools):
-            try:
-                params = tool.inputSchema
-                desc = getattr(tool, 'description', 'No description available')
-                name = getattr(tool, 'name', f'tool_{i}')
-                
-                if 'properties' in params:
-                    param_details = []
-                    for param_name, param_info in params['properties'].items():
-                        param_type = param_info.get('type', 'unknown')
-                        param_details.append(f"{param_name}: {param_type}")
-                    params_str = ', '.join(param_details)
-                else:
-                    params_str = 'no parameters'
-
-                tool_desc = f"{i+1}. {name}({params_str}) - {desc}"
-                tools_description.append(tool_desc)
-            except Exception as e:
-                logger.error(f"Error processing tool {i}: {e}")
-                tools_description.append(f"{i+1}. Error processing tool")
-        
-        tools_description = "\n".join(tools_description)
-        
-        return f"""
-        You are a math agent solving complex math expressions step-by-step.
-        You have access to various mathematical tools for calculations and verifications.
-
-        Available Tools:
-        {tools_description}
-
-        You must respond with EXACTLY ONE LINE in one of these formats (no additional text):
-
-        1. For function calls:
-        FUNCTION_CALL: function_name|input.param1=value1|input.param2=value2|...
-
-            - You can also use nested keys for structured inputs (e.g., input.string, input.int_list).
-            - For list-type inputs, use square brackets: input.int_list=[73,78,68,73,65]
-
-        2. For final answers:
-        FINAL_ANSWER: <NUMBER>
-
-        Instructions:
-        - Start by calling the show_reasoning tool ONLY ONCE with a list of all step-by-step reasoning steps explaining how you will solve the problem. Once called, NEVER CALL IT AGAIN UNDER ANY CIRCUMSTANCES.
-        - When reasoning, tag each step with the reasoning type (e.g., [Arithmetic], [Logical Check]).
-        - Use all available math tools to solve the problem step-by-step.
-        - When a function returns multiple values, process all of them.
-        - Apply BODMAS rules: start with the innermost parentheses and work outward.
-        - Do not skip steps — perform all calculations sequentially.
-        - Respond only with one line at a time.
-        - Call only one tool per response.
-        - After calculating a number, verify it by calling:
-        FUNCTION_CALL: verify_calculation|input.expression=<MATH_EXPRESSION>|input.expected=<NUMBER>
-        - If verify_calculation returns False, re-evaluate your previous steps.
-        - Once you reach a final answer, check for consistency of all steps and calculations by calling:
-        FUNCTION_CALL: verify_consistency|input.steps=[[<MATH_EXPRESSION1>, <ANSWER1>], [<MATH_EXPRESSION2>, <ANSWER2>], ...]
-        - If verify_consistency returns False, re-evaluate your previous steps.
-        - Once verify_consistency return True, submit your final result as:
-        FINAL_ANSWER: <NUMBER>
+# The Gemini client is built on first use (or during background warm-up)
+action_layer.set_llm_client_factory(create_llm_client)
 
-        
-        ✅ Examples:
-        - FUNCTION_CALL: add|input.a=5|input.b=3
-        - FUNCTION_CALL: show_reasoning|input.steps=["First, add 2 and 20. [Arithmetic]", "Then, the result is the final answer. [Final Answer]"]
-        - FUNCTION_CALL: strings_to_chars_to_int|input.string=INDIA
-        - FUNCTION_CALL: int_list_to_exponential_sum|input.int_list=[73,78,68,73,65]
-        - FINAL_ANSWER: 42
+# All LLM calls go through the gateway: rate limit, concurrency cap, retries, hedging
+llm_gateway = LLMGateway(
+    GeminiBackend(action_layer.get_llm_client),
+    rate_per_second=float(os.getenv("LLM_RATE_PER_SECOND", "5")),
+    burst=int(os.getenv("LLM_BURST", "10")),
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "4")),
+    max_retries=int(os.getenv("LLM_MAX_RETRIES", "3")),
+    hedge=os.getenv("LLM_HEDGE", "0") == "1"
+)
+action_layer.set_llm_gateway(llm_gateway)
+
+# Routine turns use the fast models; failures escalate to the strong ones
+model_router = ModelRouter(
+    fast_models=os.getenv("LLM_FAST_MODELS", "gemini-2.0-flash-lite,gemini-2.0-flash").split(","),
+    strong_models=os.getenv("LLM_STRONG_MODELS", "gemini-2.5-flash").split(",")
+)
+action_layer.set_model_router(model_router)
+
+SYSTEM_PROMPT_TEMPLATE = """You are a math agent solving math expressions step by step with tools.
 
+Tools (use these exact dotted parameter names):
+{catalog}
 
-        Strictly follow the above guidelines.
-        Your entire response should always be a single line starting with either FUNCTION_CALL: or FINAL_ANSWER:
-        """
+Reply with EXACTLY ONE line and nothing else, either:
+FUNCTION_CALL: tool_name|input.a=5|input.b=3
+FINAL_ANSWER: <NUMBER>
+
+Rules:
+- First call show_reasoning ONCE with all planned steps, each tagged with its reasoning type (e.g. [Arithmetic]). Never call it again.
+- Apply BODMAS (innermost parentheses first). One tool call per operation; do not skip steps.
+- Lists use square brackets: input.l=[73,78,68,73,65]. If a tool returns several values, use all of them.
+- A list result stored at result://<id> is passed on as input.l=result://<id>.
+- Every tool result is verified automatically ("Verified" or "Verification FAILED"). Redo a step that FAILED.
+- When all steps are done, reply FINAL_ANSWER: <NUMBER>."""
+
+async def create_system_prompt(tools) -> str:
+    """Create system prompt with available tools (cached until the tool list changes)"""
+    try:
+        # Verification happens automatically on the client, so the model never needs these tools
+        prompt = tool_catalog.render(tools, exclude=LOCAL_VERIFICATION_TOOLS, template=SYSTEM_PROMPT_TEMPLATE)
+        stats = tool_catalog.stats()
+        logger.info(f"System prompt: ~{stats['prompt_tokens']} tokens (tool catalog ~{stats['catalog_tokens']})")
+        return prompt
     except Exception as e:
         logger.error(f"Error creating system prompt: {e}")
         return "Error loading tools"
@@ -125,6 +149,10 @@ async def create_system_prompt(tools) -> str:
 
 async def initialize_session():
     """Initialize MCP session and tools"""
+    global _session_stack
+    from mcp import ClientSession, StdioServerParameters
+    from mcp.client.stdio import stdio_client
+
     current_dir = os.path.dirname(os.path.abspath(__file__))
     server_path = os.path.join(current_dir, "mcp_server.py")
     
@@ -133,37 +161,98 @@ async def initialize_session():
         args=[server_path]
     )
 
-    async with stdio_client(server_params) as (read, write):
+    # Keep the stdio transport and session open for the life of the process
+    stack = AsyncExitStack()
+    try:
+        read, write = await stack.enter_async_context(stdio_client(server_params))
         logger.info("Connection established, creating session...")
-        async with ClientSession(read, write) as session:
-            await session.initialize()
-            
-            # Get available tools
-            tools_result = await session.list_tools()
-            tools = tools_result.tools
-            
-            # Store session and tools in memory layer
-            memory_layer.store_mcp_session(session)
-            memory_layer.store_tools(tools)
-            
-            # Create and store system prompt
-            system_prompt = await create_system_prompt(tools)
-            memory_layer.store_system_prompt(system_prompt)
-            
-            return session, tools
+        session = await stack.enter_async_context(ClientSession(read, write))
+        await session.initialize()
+        
+        # Get available tools
+        tools_result = await session.list_tools()
+        tools = tools_result.tools
+    except Exception:
+        await stack.aclose()
+        raise
+    _session_stack = stack
+    
+    # Store session and tools in memory layer
+    memory_layer.store_mcp_session(session)
+    memory_layer.store_tools(tools)
+    
+    # Create and store system prompt
+    system_prompt = await create_system_prompt(tools)
+    memory_layer.store_system_prompt(system_prompt)
+    
+    return session, tools
+
+async def ensure_session():
+    """Initialize the MCP session once, even when several callers race for it"""
+    global _session_lock
+    if _session_lock is None:
+        _session_lock = asyncio.Lock()
+    async with _session_lock:
+        if memory_layer.get_mcp_session() is None or not memory_layer.get_tools():
+            await initialize_session()
 
 # Initialize MCP session on startup
 async def init_app():
     """Initialize application state"""
+    global _startup_error
     try:
-        await initialize_session()
-        logger.info("MCP session initialized successfully")
+        await ensure_session()
+        _startup_error = None
+        logger.info(
+            f"MCP session initialized successfully "
+            f"({time.monotonic() - _process_started_at:.2f}s after process start)"
+        )
     except Exception as e:
+        _startup_error = str(e)
         logger.error(f"Failed to initialize MCP session: {e}")
+        return
+
+    # Build the LLM client off the request path as well. The google.genai import is
+    # slow, so it runs in a worker thread to keep the event loop serving requests.
+    # A failure here does not affect readiness; it is retried on the first LLM call.
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, action_layer.get_llm_client)
+    except Exception as e:
+        logger.error(f"Failed to create LLM client: {e}")
+
+def start_warmup():
+    """Start warming the MCP session in the background (idempotent)"""
+    global _warmup_future
+    with _startup_lock:
+        if _warmup_future is None or (_warmup_future.done() and not is_ready()):
+            _warmup_future = asyncio.run_coroutine_threadsafe(init_app(), get_event_loop())
+        return _warmup_future
+
+def is_ready() -> bool:
+    """Check whether the MCP session and tools are available"""
+    return memory_layer.get_mcp_session() is not None and bool(memory_layer.get_tools())
 
-# Run initialization
-loop = get_or_create_event_loop()
-loop.run_until_complete(init_app())
+@app.before_request
+def ensure_warmup_started():
+    """Kick off background warm-up when running under a WSGI server"""
+    start_warmup()
+
+@app.route('/api/healthz', methods=['GET'])
+def liveness():
+    """Liveness probe: the HTTP server is up"""
+    return jsonify({
+        "status": "alive",
+        "uptime_seconds": round(time.monotonic() - _process_started_at, 3)
+    })
+
+@app.route('/api/readyz', methods=['GET'])
+def readiness():
+    """Readiness probe: the MCP session is warmed up and tools are loaded"""
+    if is_ready():
+        return jsonify({"status": "ready", "tools": len(memory_layer.get_tools())})
+    if _startup_error:
+        return jsonify({"status": "failed", "error": _startup_error}), 503
+    return jsonify({"status": "starting"}), 503
 
 @app.route('/api/preferences', methods=['POST'])
 def set_user_preferences():
@@ -197,48 +286,116 @@ def evaluate_math_expression():
         
         if not expression:
             return jsonify({"error": "No expression provided"}), 400
+
+        mode = data.get('mode', EXECUTION_MODE)
+        if mode not in EXECUTION_MODES:
+            return jsonify({"error": f"Invalid mode. Use one of: {', '.join(EXECUTION_MODES)}"}), 400
+
+        deadline_ms = data.get('deadline_ms', request.headers.get('X-Request-Deadline-Ms'))
+        try:
+            deadline_seconds = min(float(deadline_ms) / 1000, REQUEST_DEADLINE_SECONDS) if deadline_ms else REQUEST_DEADLINE_SECONDS
+        except ValueError:
+            return jsonify({"error": "Invalid deadline_ms"}), 400
             
-        loop = get_or_create_event_loop()
-        result = loop.run_until_complete(main(expression))
+        coro = main(expression, mode, deadline_seconds)
+        if api_profiler.should_profile(force=is_admin(request.headers.get('X-Profile'))):
+            coro = api_profiler.profile_coroutine(coro, f"evaluate-{mode}")
+
+        # The grace period covers returning the partial result after the deadline fires
+        result = run_async(coro, timeout=deadline_seconds + 5)
         return jsonify(result)
+
+    except concurrent.futures.TimeoutError:
+        logger.error("Request did not finish within its deadline")
+        return jsonify({"error": "Request deadline exceeded"}), 504
         
     except Exception as e:
         logger.error(f"Error processing expression: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/llm/stats', methods=['GET'])
+def llm_stats():
+    """LLM gateway counters, latency percentiles, per-model routing and prompt size stats"""
+    return jsonify({
+        **llm_gateway.stats(),
+        "routing": model_router.to_dict(),
+        "prompt": tool_catalog.stats()
+    })
+
+def is_admin(token) -> bool:
+    """Check a profiling admin token"""
+    return bool(PROFILE_ADMIN_TOKEN and token) and hmac.compare_digest(token, PROFILE_ADMIN_TOKEN)
+
+@app.route('/api/admin/profile', methods=['GET', 'POST'])
+def profile_admin():
+    """Arm profiling for the next N requests (POST {"requests": N}) or list the artifacts (GET)"""
+    if not is_admin(request.headers.get('X-Admin-Token')):
+        return jsonify({"error": "Forbidden"}), 403
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            count = int(data.get('requests', 1))
+        except (TypeError, ValueError):
+            return jsonify({"error": "Invalid requests count"}), 400
+        api_profiler.arm(count)
+    return jsonify({
+        "armed": api_profiler.remaining,
+        "artifacts": api_profiler.list_artifacts()
+    })
+
+@app.route('/api/admin/profile/<path:name>', methods=['GET'])
+def profile_artifact(name):
+    """Download a profiling artifact (.prof files load in pstats or snakeviz)"""
+    if not is_admin(request.headers.get('X-Admin-Token')):
+        return jsonify({"error": "Forbidden"}), 403
+    return send_from_directory(api_profiler.output_dir, name, as_attachment=True)
+
 @app.route('/api/test', methods=['GET'])
 def test_endpoint():
     return jsonify({"message": "Flask API is working!"})
 
-async def main(expression=None):
+async def main(expression=None, mode="step", deadline_seconds=REQUEST_DEADLINE_SECONDS):
     """Main execution flow"""
-    memory_layer.reset_state()
     logger.info("Starting main execution...")
+    deadline = Deadline(deadline_seconds)
+    request_memory = None
     
     try:
         # Initialize session if not already done
-        is_ready, error_msg = decision_layer.check_prerequisites(memory_layer)
-        if not is_ready:
-            await initialize_session()
+        prerequisites_met, error_msg = decision_layer.check_prerequisites(memory_layer)
+        if not prerequisites_met:
+            await ensure_session()
+
+        # Concurrent requests interleave on the shared event loop, so each gets its own state
+        request_memory = memory_layer.for_request()
+        request_memory.store_deadline(deadline)
+
+        if mode == "plan":
+            return await plan_executor.run(expression, request_memory, perception_layer, action_layer)
+
+        # Iterations are capped by the expression's estimated complexity
+        request_memory.set_iteration_budget(decision_layer.estimate_iteration_budget(expression))
+
+        if mode == "native":
+            return await native_agent.run(expression, request_memory, perception_layer, decision_layer, action_layer)
             
         # Main execution loop
         current_query = expression
         final_answer = None
         
-        while memory_layer.should_continue():
-            logger.info(f"Iteration {memory_layer.get_iteration_count() + 1}")
+        while request_memory.should_continue():
+            if deadline.expired():
+                raise DeadlineExceeded(f"Request deadline of {deadline_seconds:.1f}s exceeded")
+            logger.info(f"Iteration {request_memory.get_iteration_count() + 1}")
             
             # Generate LLM response using action layer
-            prompt = f"{memory_layer.get_system_prompt()}\n\nQuery: {current_query}"
-            memory_layer.store_system_prompt(prompt)  # Update prompt in memory
+            request_memory.set_current_prompt(f"{request_memory.get_system_prompt()}\n\nQuery: {current_query}")
             
-            try:
-                response_text = await action_layer._generate_retry(memory_layer)
-                if not response_text:
-                    logger.error("Empty response from LLM")
-                    break
-            except Exception as e:
-                logger.error(f"Failed to get LLM response: {e}")
+            response_text = await action_layer._generate_retry(
+                request_memory, escalate=decision_layer.should_escalate(request_memory)
+            )
+            if not response_text:
+                logger.error("Empty response from LLM")
                 break
                 
             # Parse response
@@ -246,35 +403,73 @@ async def main(expression=None):
             
             # Determine next action
             action_type, action_params = await decision_layer.determine_next_action(
-                response_type, function_parts, raw_response, memory_layer
+                response_type, function_parts, raw_response, request_memory
             )
             
             # Execute action
             result = await action_layer.execute_action(
-                action_type, action_params, memory_layer, perception_layer
+                action_type, action_params, request_memory, perception_layer
             )
             
             if action_type == "final_answer":
-                final_answer = action_params["response"]
+                is_consistent, verdict = await decision_layer.verify_final_answer_async(
+                    expression, action_params["response"], request_memory.get_decimal_places(), deadline
+                )
+                action_layer.report_outcome(request_memory, is_consistent)
+                if is_consistent:
+                    final_answer = action_params["response"]
+                    break
+                request_memory.record_step_outcome(False)
+                request_memory.add_step("FINAL_ANSWER", action_params["response"], verdict)
+            elif action_type == "function_call":
+                # Verify the tool result locally instead of spending a turn on verify_* tools
+                verdict = decision_layer.verify_tool_result(
+                    action_params["function_name"], action_params.get("params"), result
+                )
+                step_ok = not result.startswith("Error") and not (verdict or "").startswith("Verification FAILED")
+                action_layer.report_outcome(request_memory, step_ok)
+                request_memory.record_step_outcome(step_ok)
+                observation = f"{result}. {verdict}" if verdict else result
+                request_memory.add_step(
+                    action_params["function_name"],
+                    action_params.get("params", action_params["param_parts"]),
+                    observation
+                )
+                if not result.startswith("Error"):
+                    request_memory.set_last_response(result)
+            elif action_type == "finish":
                 break
+            else:
+                action_layer.report_outcome(request_memory, False)
+                request_memory.record_step_outcome(False)
+                request_memory.add_step("response", raw_response, result)
                 
-            memory_layer.increment_iteration()
-            
-            # Update query for next iteration
-            if memory_layer.get_last_response():
-                current_query = f"{expression}\n\n{' '.join(memory_layer.get_iteration_responses())}\nWhat should you do next?"
+            request_memory.increment_iteration()
             
-            memory_layer.set_last_response(result)
+            # Update query for next iteration (bounded by the history window)
+            current_query = f"{expression}\n\nSteps so far:\n{request_memory.render_history()}\nWhat should you do next?"
 
         return {"result": final_answer if final_answer else "No result found"}
 
+    except DeadlineExceeded as e:
+        # Return the latest successful tool result as the best partial answer
+        logger.warning(f"{e}; returning partial result")
+        return {
+            "result": (request_memory and request_memory.get_last_response()) or "No result found",
+            "partial": True,
+            "error": str(e)
+        }
+    except LLMError as e:
+        logger.error(f"Failed to get LLM response: {e}")
+        return {"error": str(e)}
     except Exception as e:
         logger.error(f"Error in main execution: {e}")
         return {"error": str(e)}
-    finally:
-        memory_layer.reset_state()
 
 if __name__ == "__main__":
+    warmup = start_warmup()
+    if STARTUP_MODE == "eager":
+        warmup.result()
     logger.info("Starting Flask server...")
     app.run(debug=True, port=5000)
 
@@ -1,20 +1,87 @@
 # basic import 
-from mcp.server.fastmcp import FastMCP, Image
+from mcp.server.fastmcp import Context, FastMCP, Image
 from mcp.server.fastmcp.prompts import base
 from mcp.types import TextContent
 from mcp import types
-from PIL import Image as PILImage
+import io
+import json
 import math
-from rich.console import Console
-from rich.panel import Panel
-from rich.table import Table
-from rich import box
+import os
 import re
+import signal
 import sys
+import weakref
 from models import *
+from tool_cache import pure, tool_cache
+from consistency import ConsistencyEngine
+from result_store import LARGE_RESULT_CHARS, result_store, summarize
+from profiling import Profiler
+
+# Number of tool calls profiled after SIGUSR1, and at startup if MCP_PROFILE_ON_START=1
+MCP_PROFILE_CALLS = int(os.getenv("MCP_PROFILE_CALLS", "10"))
+
+tool_profiler = Profiler("mcp")
+
+class ProfiledFastMCP(FastMCP):
+    """FastMCP server whose next N tool calls can be profiled on demand"""
+    async def call_tool(self, name, arguments):
+        if not tool_profiler.should_profile():
+            return await super().call_tool(name, arguments)
+        with tool_profiler.profile(name):
+            return await super().call_tool(name, arguments)
+
+def arm_profiler(*_):
+    """Signal handler: profile the next MCP_PROFILE_CALLS tool calls"""
+    tool_profiler.arm(MCP_PROFILE_CALLS)
+
 # instantiate an MCP server client
-console = Console()
-mcp = FastMCP("AdvancedCalculator")
+mcp = ProfiledFastMCP("AdvancedCalculator")
+
+# Heavy display/imaging libraries (rich, PIL) are imported on first use so the
+# server can answer `initialize` as soon as possible.
+_console = None
+
+def get_console():
+    """Get the rich console, creating it on first use"""
+    global _console
+    if _console is None:
+        from rich.console import Console
+        _console = Console()
+    return _console
+
+def text_output(text: str, array: Any = None, list_input: bool = False) -> ToolOutput:
+    """
+    Wrap a text result; large ones are stored as a result:// resource and summarized.
+    `array` is the decoded numeric value of a list result, kept so list tools can take the handle.
+    """
+    if len(text) <= LARGE_RESULT_CHARS:
+        return ToolOutput(content=TextContent(type="text", text=text))
+    handle = result_store.put(text, array)
+    return ToolOutput(content=TextContent(type="text", text=summarize(text, handle, list_input)), handle=handle)
+
+# One incremental consistency engine per client session
+_consistency_engines: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+def list_output(values: List[int]) -> ToolOutput:
+    """Wrap an integer list result, keeping an int64 array of it when it is stored by handle"""
+    text = str(values)
+    if len(text) <= LARGE_RESULT_CHARS:
+        return text_output(text)
+    import numpy as np
+    try:
+        array = np.array(values, dtype=np.int64)
+    except OverflowError:
+        # e.g. Fibonacci numbers past the 93rd; list tools parse the text instead
+        array = None
+    return text_output(text, array, list_input=True)
+
+def get_consistency_engine(ctx: Context) -> ConsistencyEngine:
+    """Get the consistency engine of the calling session"""
+    session = ctx.session
+    engine = _consistency_engines.get(session)
+    if engine is None:
+        engine = _consistency_engines[session] = ConsistencyEngine()
+    return engine
 
 # DEFINE TOOLS
 
@@ -22,6 +89,8 @@ mcp = FastMCP("AdvancedCalculator")
 @mcp.tool()
 def show_reasoning(input: StepsInput) -> ToolOutput:
     """Show the step-by-step reasoning process"""
+    from rich.panel import Panel
+    console = get_console()
     console.print("[blue]FUNCTION CALL:[/blue] show_reasoning()")
     try:
         for i, step in enumerate(input.steps, 1):
@@ -42,6 +111,7 @@ def show_reasoning(input: StepsInput) -> ToolOutput:
 @mcp.tool()
 def verify_calculation(input: CalculationInput) -> ToolOutput:
     """Verify if a calculation is correct"""
+    console = get_console()
     console.print("[blue]FUNCTION CALL:[/blue] verify()")
     try:
         actual = float(eval(input.expression))
@@ -60,45 +130,18 @@ def verify_calculation(input: CalculationInput) -> ToolOutput:
         return ToolOutput(content=TextContent(type="text", text=f"Error: {str(e)}"), success=False, error=str(e))
 
 @mcp.tool()
-def verify_consistency(input: ConsistencyStepInput) -> ToolOutput:
+def verify_consistency(input: ConsistencyStepInput, ctx: Context) -> ToolOutput:
     """Check if calculation steps are consistent with each other"""
     try:
-        issues = []
-        warnings = []
-        insights = []
-        previous = None
-        
-        for i, (expression, result) in enumerate(input.steps, 1):
-            checks = []
-            
-            # 1. Basic Calculation Verification
-            try:
-                expected = eval(expression)
-                if abs(float(expected) - float(result)) < 1e-10:
-                    checks.append("[green] Calculation verified[/green]")
-                else:
-                    issues.append(f"Step {i}: Calculation mismatch")
-                    checks.append("[red] Calculation error[/red]")
-            except:
-                warnings.append(f"Step {i}: Couldn't verify calculation")
-                checks.append("[yellow] Verification failed[/yellow]")
-
-            # Rest of verification logic remains same...
-
-            previous = (expression, result)
-
-        total_checks = len(input.steps) * 5
-        passed_checks = total_checks - (len(issues) * 2 + len(warnings))
-        consistency_score = (passed_checks / total_checks) * 100
+        # Steps already verified in this session are not re-evaluated
+        report = get_consistency_engine(ctx).check(input.steps)
+        consistency_score = report["consistency_score"]
 
         return ToolOutput(
             content=TextContent(
                 type="text",
                 text=str({
-                    "consistency_score": consistency_score,
-                    "issues": issues,
-                    "warnings": warnings,
-                    "insights": insights,
+                    **report,
                     "result": consistency_score > 80,
                     "next_step": "Return the final result as FINAL_ANSWER: <NUMBER>" if consistency_score > 80 else "Please review the steps and try again."
                 })
@@ -109,6 +152,7 @@ def verify_consistency(input: ConsistencyStepInput) -> ToolOutput:
 
 #addition tool
 @mcp.tool()
+@pure
 def add(input: MathInput) -> ToolOutput:
     """Add two numbers"""
     print("CALLED: add(input: MathInput)")
@@ -119,16 +163,22 @@ def add(input: MathInput) -> ToolOutput:
         return ToolOutput(content=TextContent(type="text", text=str(e)), success=False, error=str(e))
 
 @mcp.tool()
+@pure
 def add_list(input: ListInput) -> ToolOutput:
     """Add all numbers in a list"""
     print("CALLED: add_list(input: ListInput)")
     try:
-        result = sum(input.l)
+        values = input.as_array()
+        result = values.sum().item()
+        if values.dtype.kind == "i" and abs(values.sum(dtype=float)) >= 2 ** 62:
+            # int64 sums wrap silently; add exactly with Python ints near the limit
+            result = sum(values.tolist())
         return ToolOutput(content=TextContent(type="text", text=str(result)))
     except Exception as e:
         return ToolOutput(content=TextContent(type="text", text=str(e)), success=False, error=str(e))
 
 @mcp.tool()
+@pure
 def subtract(input: MathInput) -> ToolOutput:
     """Subtract two numbers"""
     print("CALLED: subtract(input: MathInput)")
@@ -139,6 +189,7 @@ def subtract(input: MathInput) -> ToolOutput:
         return ToolOutput(content=TextContent(type="text", text=str(e)), success=False, error=str(e))
 
 @mcp.tool()
+@pure
 def multiply(input: MathInput) -> ToolOutput:
     """Multiply two numbers"""
     print("CALLED: multiply(input: MathInput)")
@@ -149,6 +200,7 @@ def multiply(input: MathInput) -> ToolOutput:
         return ToolOutput(content=TextContent(type="text", text=str(e)), success=False, error=str(e))
 
 @mcp.tool()
+@pure
 def divide(input: MathInput) -> ToolOutput:
     """Divide two numbers"""
     print("CALLED: divide(input: MathInput)")
@@ -161,6 +213,7 @@ def divide(input: MathInput) -> ToolOutput:
         return ToolOutput(content=TextContent(type="text", text=str(e)), success=False, error=str(e))
 
 @mcp.tool()
+@pure
 def power(input: MathInput) -> ToolOutput:
     """Power of two numbers"""
     print("CALLED: power(input: MathInput)")
@@ -171,6 +224,7 @@ def power(input: MathInput) -> ToolOutput:
         return ToolOutput(content=TextContent(type="text", text=str(e)), success=False, error=str(e))
 
 @mcp.tool()
+@pure
 def sqrt(input: SingleNumberInput) -> ToolOutput:
     """Square root of a number"""
     print("CALLED: sqrt(input: SingleNumberInput)")
@@ -181,6 +235,7 @@ def sqrt(input: SingleNumberInput) -> ToolOutput:
         return ToolOutput(content=TextContent(type="text", text=str(e)), success=False, error=str(e))
 
 @mcp.tool()
+@pure
 def cbrt(input: SingleNumberInput) -> ToolOutput:
     """Cube root of a number"""
     print("CALLED: cbrt(input: SingleNumberInput)")
@@ -191,6 +246,7 @@ def cbrt(input: SingleNumberInput) -> ToolOutput:
         return ToolOutput(content=TextContent(type="text", text=str(e)), success=False, error=str(e))
 
 @mcp.tool()
+@pure
 def factorial(input: SingleNumberInput) -> ToolOutput:
     """Factorial of a number"""
     print("CALLED: factorial(input: SingleNumberInput)")
@@ -201,6 +257,7 @@ def factorial(input: SingleNumberInput) -> ToolOutput:
         return ToolOutput(content=TextContent(type="text", text=str(e)), success=False, error=str(e))
 
 @mcp.tool()
+@pure
 def log(input: SingleNumberInput) -> ToolOutput:
     """Log of a number"""
     print("CALLED: log(input: SingleNumberInput)")
@@ -213,6 +270,7 @@ def log(input: SingleNumberInput) -> ToolOutput:
         return ToolOutput(content=TextContent(type="text", text=str(e)), success=False, error=str(e))
 
 @mcp.tool()
+@pure
 def remainder(input: MathInput) -> ToolOutput:
     """Remainder of two numbers division"""
     print("CALLED: remainder(input: MathInput)")
@@ -225,6 +283,7 @@ def remainder(input: MathInput) -> ToolOutput:
         return ToolOutput(content=TextContent(type="text", text=str(e)), success=False, error=str(e))
 
 @mcp.tool()
+@pure
 def sin(input: SingleNumberInput) -> ToolOutput:
     """Sine of a number"""
     print("CALLED: sin(input: SingleNumberInput)")
@@ -235,6 +294,7 @@ def sin(input: SingleNumberInput) -> ToolOutput:
         return ToolOutput(content=TextContent(type="text", text=str(e)), success=False, error=str(e))
 
 @mcp.tool()
+@pure
 def cos(input: SingleNumberInput) -> ToolOutput:
     """Cosine of a number"""
     print("CALLED: cos(input: SingleNumberInput)")
@@ -245,6 +305,7 @@ def cos(input: SingleNumberInput) -> ToolOutput:
         return ToolOutput(content=TextContent(type="text", text=str(e)), success=False, error=str(e))
 
 @mcp.tool()
+@pure
 def tan(input: SingleNumberInput) -> ToolOutput:
     """Tangent of a number"""
     print("CALLED: tan(input: SingleNumberInput)")
@@ -255,6 +316,7 @@ def tan(input: SingleNumberInput) -> ToolOutput:
         return ToolOutput(content=TextContent(type="text", text=str(e)), success=False, error=str(e))
 
 @mcp.tool()
+@pure
 def mine(input: MathInput) -> ToolOutput:
     """Special mining tool"""
     print("CALLED: mine(input: MathInput)")
@@ -268,47 +330,74 @@ def mine(input: MathInput) -> ToolOutput:
 def create_thumbnail(image_path: str) -> Image:
     """Create a thumbnail from an image"""
     print("CALLED: create_thumbnail(image_path: str) -> Image:")
+    from PIL import Image as PILImage
     img = PILImage.open(image_path)
     img.thumbnail((100, 100))
-    return Image(data=img.tobytes(), format="png")
+    # Send compressed PNG bytes rather than the raw pixel buffer
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    return Image(data=buffer.getvalue(), format="png")
 
 @mcp.tool()
+@pure
 def strings_to_chars_to_int(input: StringInput) -> ToolOutput:
     """Return the ASCII values of the characters in a word"""
     print("CALLED: strings_to_chars_to_int(input: StringInput)")
     try:
         result = [ord(char) for char in input.string]
-        return ToolOutput(content=TextContent(type="text", text=str(result)))
+        return list_output(result)
     except Exception as e:
         return ToolOutput(content=TextContent(type="text", text=str(e)), success=False, error=str(e))
 
 @mcp.tool()
+@pure
 def int_list_to_exponential_sum(input: ListInput) -> ToolOutput:
     """Return sum of exponentials of numbers in a list"""
     print("CALLED: int_list_to_exponential_sum(input: ListInput)")
     try:
-        result = sum(math.exp(i) for i in input.l)
+        import numpy as np
+        with np.errstate(over="raise"):
+            result = np.exp(input.as_array(), dtype=float).sum().item()
         return ToolOutput(content=TextContent(type="text", text=str(result)))
     except Exception as e:
         return ToolOutput(content=TextContent(type="text", text=str(e)), success=False, error=str(e))
 
 @mcp.tool()
+@pure
 def fibonacci_numbers(input: SingleNumberInput) -> ToolOutput:
     """Return the first n Fibonacci Numbers"""
     print("CALLED: fibonacci_numbers(input: SingleNumberInput)")
     try:
-        if input.a <= 0:
+        n = int(input.a)
+        if n <= 0:
             return ToolOutput(content=TextContent(type="text", text="[]"))
         fib_sequence = [0, 1]
-        for _ in range(2, input.a):
+        for _ in range(2, n):
             fib_sequence.append(fib_sequence[-1] + fib_sequence[-2])
-        return ToolOutput(content=TextContent(type="text", text=str(fib_sequence[:input.a])))
+        return list_output(fib_sequence[:n])
     except Exception as e:
         return ToolOutput(content=TextContent(type="text", text=str(e)), success=False, error=str(e))
 
 
 # DEFINE RESOURCES
 
+# Hit-rate and size of the pure tool result cache
+@mcp.resource("cache://stats")
+def get_cache_stats() -> str:
+    """Get statistics of the pure tool result cache"""
+    return json.dumps(tool_cache.stats())
+
+# Large tool results, read by handle in ranges
+@mcp.resource("result://{result_id}")
+def get_result_info(result_id: str) -> str:
+    """Get the size and a preview of a stored large result"""
+    return json.dumps(result_store.info(result_id))
+
+@mcp.resource("result://{result_id}/{offset}/{length}")
+def read_result_range(result_id: str, offset: str, length: str) -> str:
+    """Read a range of characters of a stored large result"""
+    return result_store.read(result_id, int(offset), int(length))
+
 # Add a dynamic greeting resource
 @mcp.resource("greeting://{name}")
 def get_greeting(name: str) -> str:
@@ -335,6 +424,11 @@ def debug_error(error: str) -> list[base.Message]:
 if __name__ == "__main__":
     # Check if running with mcp dev command
     print("STARTING")
+    # SIGUSR1 is not available on Windows; use MCP_PROFILE_ON_START there
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, arm_profiler)
+    if os.getenv("MCP_PROFILE_ON_START") == "1":
+        arm_profiler()
     if len(sys.argv) > 1 and sys.argv[1] == "dev":
         mcp.run()  # Run without transport for dev server
     else:
@@ -1,16 +1,65 @@
-from typing import Any, List, Optional, Dict
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, List, Optional, Dict
+
+@dataclass
+class StepRecord:
+    """One step of the iteration history: a tool call (or model response) and its result"""
+    call: str
+    args: Any
+    result: str
+    max_args_chars: int = 200
+
+    def render(self) -> str:
+        if isinstance(self.args, dict):
+            # Show tool arguments without the `input` wrapper
+            args = self.args.get("input", self.args)
+            args_str = ", ".join(f"{k}={v}" for k, v in args.items()) if isinstance(args, dict) else str(args)
+            return f"{self.call}({_truncate(args_str, self.max_args_chars)}) -> {self.result}"
+        if self.args is not None:
+            return f"{self.call}: {_truncate(str(self.args), self.max_args_chars)} -> {self.result}"
+        return f"{self.call}: {self.result}"
+
+    def size(self) -> int:
+        return len(self.call) + min(len(str(self.args)), self.max_args_chars) + len(self.result)
+
+def _truncate(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit] + f"... [{len(text) - limit} chars truncated]"
 
 class MemoryLayer:
-    def __init__(self):
+    def __init__(
+        self,
+        history_window: int = 8,
+        max_result_chars: int = 500,
+        max_history_chars: int = 4000,
+        max_digest_chars: int = 600
+    ):
         self.user_preferences: Optional[Dict[str, Any]] = None
         self.last_response = None
         self.iteration = 0
-        self.iteration_response: List[str] = []
-        self.max_iterations = 20
+        self.default_max_iterations = 20
+        self.max_iterations = self.default_max_iterations
+        self.deadline = None
+        self.consecutive_failures = 0
         self.tools = None
         self.system_prompt = None
+        self.current_prompt: Optional[str] = None
+        self.last_model: Optional[str] = None
         self.mcp_session = None
 
+        # Bounded iteration history: the last `history_window` steps are kept in full,
+        # older ones are folded into a short digest.
+        self.history_window = history_window
+        self.max_result_chars = max_result_chars
+        self.max_history_chars = max_history_chars
+        self.max_digest_chars = max_digest_chars
+        self.steps: Deque[StepRecord] = deque()
+        self.steps_size = 0
+        self.digest: Deque[str] = deque()
+        self.digest_size = 0
+        self.digest_dropped = 0
+        self.rendered_history: Optional[str] = None
+
     def store_user_preferences(self, preferences: Dict[str, Any]) -> None:
         """Store user preferences in memory"""
         self.user_preferences = preferences
@@ -19,19 +68,87 @@ class MemoryLayer:
         """Retrieve stored user preferences"""
         return self.user_preferences
 
+    def get_decimal_places(self) -> Optional[int]:
+        """Preferred number of decimal places for results, if set"""
+        return (self.user_preferences or {}).get("decimal_places")
+
     def has_preferences(self) -> bool:
         """Check if user preferences are set"""
         return self.user_preferences is not None
 
+    def for_request(self) -> "MemoryLayer":
+        """
+        Fresh iteration state for one request. Requests share the event loop, so the
+        deadline, budget and history must not live on the process-wide instance;
+        preferences, tools, system prompt and MCP session are shared.
+        """
+        memory = MemoryLayer(
+            history_window=self.history_window,
+            max_result_chars=self.max_result_chars,
+            max_history_chars=self.max_history_chars,
+            max_digest_chars=self.max_digest_chars
+        )
+        memory.user_preferences = self.user_preferences
+        memory.default_max_iterations = memory.max_iterations = self.default_max_iterations
+        memory.tools = self.tools
+        memory.system_prompt = self.system_prompt
+        memory.mcp_session = self.mcp_session
+        return memory
+
     def reset_state(self) -> None:
         """Reset iteration state"""
         self.last_response = None
         self.iteration = 0
-        self.iteration_response = []
+        self.max_iterations = self.default_max_iterations
+        self.deadline = None
+        self.consecutive_failures = 0
+        self.current_prompt = None
+        self.last_model = None
+        self.steps.clear()
+        self.steps_size = 0
+        self.digest.clear()
+        self.digest_size = 0
+        self.digest_dropped = 0
+        self.rendered_history = None
+
+    def add_step(self, call: str, args: Any, result: Any) -> None:
+        """Record a step in the bounded iteration history"""
+        step = StepRecord(call, args, _truncate(str(result), self.max_result_chars))
+        self.steps.append(step)
+        self.steps_size += step.size()
+        # Keep the full-detail window within both the step count and the memory cap
+        while len(self.steps) > self.history_window or (
+            self.steps_size > self.max_history_chars and len(self.steps) > 1
+        ):
+            self._summarize_step(self.steps.popleft())
+        self.rendered_history = None
+
+    def _summarize_step(self, step: StepRecord) -> None:
+        """Fold an evicted step into the digest of older steps"""
+        self.steps_size -= step.size()
+        summary = _truncate(step.render(), 80)
+        self.digest.append(summary)
+        self.digest_size += len(summary)
+        while self.digest_size > self.max_digest_chars and self.digest:
+            self.digest_size -= len(self.digest.popleft())
+            self.digest_dropped += 1
 
     def add_iteration_response(self, response: str) -> None:
-        """Add a response to the iteration history"""
-        self.iteration_response.append(response)
+        """Add a free-text response to the iteration history"""
+        self.add_step("note", None, response)
+
+    def render_history(self) -> str:
+        """Render the digest and the recent steps as compact prompt text"""
+        if self.rendered_history is None:
+            lines = []
+            if self.digest or self.digest_dropped:
+                earlier = "; ".join(self.digest)
+                if self.digest_dropped:
+                    earlier = f"({self.digest_dropped} older steps omitted) {earlier}"
+                lines.append(f"Earlier steps: {earlier}")
+            lines.extend(step.render() for step in self.steps)
+            self.rendered_history = "\n".join(lines)
+        return self.rendered_history
 
     def increment_iteration(self) -> None:
         """Increment the iteration counter"""
@@ -42,8 +159,8 @@ class MemoryLayer:
         return self.iteration
 
     def get_iteration_responses(self) -> List[str]:
-        """Get all iteration responses"""
-        return self.iteration_response
+        """Get the recent iteration history as rendered strings"""
+        return [step.render() for step in self.steps]
 
     def set_last_response(self, response: Any) -> None:
         """Set the last response"""
@@ -69,6 +186,42 @@ class MemoryLayer:
         """Get stored system prompt"""
         return self.system_prompt
 
+    def set_iteration_budget(self, max_iterations: int) -> None:
+        """Set the iteration cap for the current request"""
+        self.max_iterations = max_iterations
+
+    def record_step_outcome(self, ok: bool) -> None:
+        """Track consecutive unusable steps (parse failures, failed verifications, errors)"""
+        self.consecutive_failures = 0 if ok else self.consecutive_failures + 1
+
+    def get_consecutive_failures(self) -> int:
+        """Get the number of consecutive unusable steps"""
+        return self.consecutive_failures
+
+    def store_deadline(self, deadline: Any) -> None:
+        """Store the deadline of the current request"""
+        self.deadline = deadline
+
+    def get_deadline(self) -> Any:
+        """Get the deadline of the current request (None if unbounded)"""
+        return self.deadline
+
+    def set_current_prompt(self, prompt: str) -> None:
+        """Set the prompt for the current iteration (system prompt plus query)"""
+        self.current_prompt = prompt
+
+    def set_last_model(self, model: str) -> None:
+        """Remember the model that produced the latest LLM response"""
+        self.last_model = model
+
+    def get_last_model(self) -> Optional[str]:
+        """Get the model that produced the latest LLM response"""
+        return self.last_model
+
+    def get_current_prompt(self) -> Optional[str]:
+        """Get the prompt for the current iteration"""
+        return self.current_prompt
+
     def store_mcp_session(self, session: Any) -> None:
         """Store MCP session"""
         self.mcp_session = session
@@ -0,0 +1,95 @@
+import random
+from typing import Any, Dict, List, Optional
+
+class ModelStats:
+    """Latency and success statistics of one model"""
+    def __init__(self, ewma_alpha: float):
+        self.ewma_alpha = ewma_alpha
+        self.calls = 0
+        self.errors = 0
+        self.good = 0
+        self.bad = 0
+        self.ewma_latency: Optional[float] = None
+
+    def record_call(self, latency: float, success: bool) -> None:
+        self.calls += 1
+        if not success:
+            self.errors += 1
+        if self.ewma_latency is None:
+            self.ewma_latency = latency
+        else:
+            self.ewma_latency += self.ewma_alpha * (latency - self.ewma_latency)
+
+    def record_outcome(self, ok: bool) -> None:
+        if ok:
+            self.good += 1
+        else:
+            self.bad += 1
+
+    def success_rate(self) -> float:
+        # Laplace smoothing so a single failure doesn't rule a model out
+        return (self.good + 1) / (self.good + self.bad + self.errors + 2)
+
+    def score(self) -> float:
+        """Successes per second of latency: higher is better"""
+        return self.success_rate() / max(self.ewma_latency or 0.0, 1e-3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "good_responses": self.good,
+            "bad_responses": self.bad,
+            "success_rate": round(self.success_rate(), 3),
+            "ewma_latency_ms": round(self.ewma_latency * 1000, 1) if self.ewma_latency is not None else None,
+        }
+
+class ModelRouter:
+    """
+    Routes each LLM turn to a model. Routine turns go to the fast tier; turns
+    after parse failures, failed verifications or retries are escalated to the
+    strong tier. Within a tier the model with the best success-rate/latency
+    score wins, after every model has been tried `min_samples` times.
+    """
+    def __init__(
+        self,
+        fast_models: List[str],
+        strong_models: Optional[List[str]] = None,
+        min_samples: int = 3,
+        explore_rate: float = 0.05,
+        ewma_alpha: float = 0.2
+    ):
+        if not fast_models:
+            raise ValueError("At least one fast model is required")
+        self.fast_models = fast_models
+        self.strong_models = strong_models or []
+        self.min_samples = min_samples
+        self.explore_rate = explore_rate
+        self.stats: Dict[str, ModelStats] = {
+            model: ModelStats(ewma_alpha) for model in self.fast_models + self.strong_models
+        }
+
+    def choose(self, escalate: bool = False) -> str:
+        """Pick the model for the next turn"""
+        tier = self.strong_models if escalate and self.strong_models else self.fast_models
+        untried = [m for m in tier if self.stats[m].calls < self.min_samples]
+        if untried:
+            return untried[0]
+        if len(tier) > 1 and random.random() < self.explore_rate:
+            return random.choice(tier)
+        return max(tier, key=lambda m: self.stats[m].score())
+
+    def record_call(self, model: str, latency: float, success: bool) -> None:
+        """Record the latency of an LLM call and whether it returned at all"""
+        self.stats[model].record_call(latency, success)
+
+    def record_outcome(self, model: str, ok: bool) -> None:
+        """Record whether the model's response was usable (parsed and verified)"""
+        self.stats[model].record_outcome(ok)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "fast_models": self.fast_models,
+            "strong_models": self.strong_models,
+            "models": {model: stats.to_dict() for model, stats in self.stats.items()}
+        }
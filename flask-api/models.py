@@ -1,6 +1,12 @@
+import base64
+import json
 from pydantic import BaseModel, Field
-from typing import List, Dict, Union, Optional, Tuple
+from typing import Annotated, Any, List, Dict, Literal, Union, Optional, Tuple
 from mcp.types import TextContent
+from result_store import result_store
+
+# A result:// handle of an earlier numeric list result
+ResultRef = Annotated[str, Field(pattern=r"^result://[0-9a-f]+$")]
 
 # Models for tool inputs and outputs
 class StepsInput(BaseModel):
@@ -17,8 +23,39 @@ class MathInput(BaseModel):
 class SingleNumberInput(BaseModel):
     a: float = Field(..., description="Input number")
 
+class PackedArray(BaseModel):
+    dtype: Literal["f8", "i8"] = Field("f8", description="f8 (float64) or i8 (int64)")
+    data: str = Field(..., description="Base64 of the little-endian values")
+
+    def to_array(self) -> Any:
+        """Decode without copying: the array is a view over the decoded bytes"""
+        import numpy as np
+        return np.frombuffer(base64.b64decode(self.data), dtype=f"<{self.dtype}")
+
+    @classmethod
+    def from_values(cls, values: Any, dtype: str = "f8") -> "PackedArray":
+        """Pack a list or array of numbers"""
+        import numpy as np
+        array = np.ascontiguousarray(values, dtype=f"<{dtype}")
+        return cls(dtype=dtype, data=base64.b64encode(array.tobytes()).decode("ascii"))
+
 class ListInput(BaseModel):
-    l: List[float] = Field(..., description="List of numbers")
+    l: Union[PackedArray, ResultRef, List[float]] = Field(
+        ..., description="List of numbers, a packed array, or the result:// handle of an earlier list result"
+    )
+
+    def as_array(self) -> Any:
+        """The numbers as a NumPy array"""
+        import numpy as np
+        if isinstance(self.l, PackedArray):
+            return self.l.to_array()
+        if isinstance(self.l, str):
+            array = result_store.get_array(self.l)
+            if array is None:
+                # Stored as text only, e.g. integers beyond int64
+                array = np.array(json.loads(result_store.get(self.l)), dtype=float)
+            return array
+        return np.asarray(self.l, dtype=float)
 
 class StringInput(BaseModel):
     string: str = Field(..., description="Input string")
@@ -29,4 +66,5 @@ class ConsistencyStepInput(BaseModel):
 class ToolOutput(BaseModel):
     content: Union[List[TextContent], TextContent]
     success: bool = True
-    error: Optional[str] = None
\ No newline at end of file
+    error: Optional[str] = None
+    handle: Optional[str] = Field(None, description="result:// handle of the full result when it was too large to inline")
\ No newline at end of file
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import re
+from typing import Any, Dict, List, Optional
+
+from catalog import ToolCatalog
+from deadline import DeadlineExceeded
+from decision import LOCAL_VERIFICATION_TOOLS
+
+logger = logging.getLogger(__name__)
+
+NATIVE_SYSTEM_PROMPT = """You are a math agent solving math expressions step by step with the provided functions.
+- Apply BODMAS (innermost parentheses first) and use one function call per operation.
+- You may call several functions at once when they do not depend on each other.
+- Every function result includes an automatic verification verdict. Redo a step whose verification FAILED.
+- When all steps are done, reply with only the final number."""
+
+# A final reply must be just the number (optionally prefixed with FINAL_ANSWER:)
+NUMBER_PATTERN = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+
+class NativeToolAgent:
+    """
+    Execution mode that passes the MCP tool schemas to the LLM as native
+    function declarations and consumes the typed function-call objects it
+    returns, so there is no free-text FUNCTION_CALL line to parse.
+    """
+    def __init__(self, catalog: Optional[ToolCatalog] = None):
+        self.catalog = catalog or ToolCatalog()
+
+    def build_config(self, tools: Any) -> Dict[str, Any]:
+        """Generation config with the tool declarations; calls are executed here, not by the SDK"""
+        return {
+            "system_instruction": NATIVE_SYSTEM_PROMPT,
+            "tools": [{"function_declarations": self.catalog.function_declarations(tools, exclude=LOCAL_VERIFICATION_TOOLS)}],
+            "automatic_function_calling": {"disable": True},
+        }
+
+    async def call_function(
+        self,
+        call: Any,
+        memory_layer: Any,
+        perception_layer: Any,
+        decision_layer: Any
+    ) -> Dict[str, Any]:
+        """Execute one function call against MCP and return its function response part"""
+        name = call.name
+        args = dict(call.args or {})
+        session = memory_layer.get_mcp_session()
+        deadline = memory_layer.get_deadline()
+        try:
+            if deadline:
+                result = await deadline.run(session.call_tool(name, args))
+            else:
+                result = await session.call_tool(name, args)
+            success, text = perception_layer.parse_tool_result(result)
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            success, text = False, str(e)
+
+        verdict = decision_layer.verify_tool_result(name, args, text) if success else None
+        step_ok = success and not (verdict or "").startswith("Verification FAILED")
+        memory_layer.record_step_outcome(step_ok)
+        memory_layer.add_step(name, args, f"{text}. {verdict}" if verdict else text)
+        if success:
+            memory_layer.set_last_response(text)
+
+        response = {"result": text} if success else {"error": text}
+        if verdict:
+            response["verification"] = verdict
+        return {"function_response": {"name": name, "response": response}}
+
+    async def run(
+        self,
+        expression: str,
+        memory_layer: Any,
+        perception_layer: Any,
+        decision_layer: Any,
+        action_layer: Any
+    ) -> Dict[str, Any]:
+        """Run the function-calling loop until the model returns a verified final answer"""
+        config = self.build_config(memory_layer.get_tools())
+        deadline = memory_layer.get_deadline()
+        contents: List[Any] = [{"role": "user", "parts": [{"text": f"Expression: {expression}"}]}]
+
+        while memory_layer.should_continue():
+            response = await action_layer.generate_content(
+                contents,
+                config=config,
+                deadline=deadline,
+                escalate=decision_layer.should_escalate(memory_layer),
+                memory_layer=memory_layer
+            )
+            memory_layer.increment_iteration()
+            calls = response.function_calls or []
+            if calls:
+                action_layer.report_outcome(memory_layer, True)
+                candidates = getattr(response, "candidates", None) or []
+                if candidates and candidates[0].content:
+                    contents.append(candidates[0].content)
+                else:
+                    contents.append({
+                        "role": "model",
+                        "parts": [{"function_call": {"name": c.name, "args": c.args}} for c in calls]
+                    })
+                # Independent calls from the same turn run concurrently
+                parts = await asyncio.gather(*(
+                    self.call_function(call, memory_layer, perception_layer, decision_layer)
+                    for call in calls
+                ))
+                contents.append({"role": "user", "parts": list(parts)})
+                continue
+
+            text = (response.text or "").strip()
+            if text.startswith("FINAL_ANSWER:"):
+                text = text.split(":", 1)[1].strip()
+            match = NUMBER_PATTERN.fullmatch(text.rstrip("."))
+            if not match:
+                action_layer.report_outcome(memory_layer, False)
+                memory_layer.record_step_outcome(False)
+                contents.append({"role": "model", "parts": [{"text": text}]})
+                contents.append({"role": "user", "parts": [{"text": "Call a function or reply with only the final number."}]})
+                continue
+
+            answer = match.group(0)
+            is_consistent, verdict = await decision_layer.verify_final_answer_async(
+                expression, answer, memory_layer.get_decimal_places(), deadline
+            )
+            action_layer.report_outcome(memory_layer, is_consistent)
+            if is_consistent:
+                return {"result": answer}
+            memory_layer.record_step_outcome(False)
+            memory_layer.add_step("FINAL_ANSWER", answer, verdict)
+            contents.append({"role": "model", "parts": [{"text": text}]})
+            contents.append({"role": "user", "parts": [{"text": verdict}]})
+
+        return {"result": "No result found"}
@@ -1,8 +1,13 @@
 import ast
+import json
 import logging
+import re
+from typing import Any, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+RESULT_HANDLE_PATTERN = re.compile(r"result://[0-9a-f]+")
+
 class PerceptionLayer:
     def __init__(self):
         pass
@@ -52,6 +57,57 @@ class PerceptionLayer:
         else:
             return "unknown", [], response_text
 
+    def parse_tool_result(self, result: Any) -> Tuple[bool, str]:
+        """
+        Unwrap an MCP tool call result into plain text.
+        Tools return a serialized ToolOutput, whose inner TextContent is extracted when present.
+        Returns: (success, text)
+        """
+        if getattr(result, 'isError', False):
+            success = False
+        else:
+            success = True
+
+        content = getattr(result, 'content', result)
+        items = content if isinstance(content, list) else [content]
+        texts = []
+        for item in items:
+            text = getattr(item, 'text', None)
+            if text is None:
+                texts.append(str(item))
+                continue
+            try:
+                payload = json.loads(text)
+            except ValueError:
+                texts.append(text)
+                continue
+            if isinstance(payload, dict) and "content" in payload:
+                # Serialized ToolOutput
+                inner = payload["content"]
+                inner_items = inner if isinstance(inner, list) else [inner]
+                texts.extend(
+                    i.get("text", "") if isinstance(i, dict) else str(i)
+                    for i in inner_items
+                )
+                if payload.get("success") is False:
+                    success = False
+            else:
+                texts.append(text)
+
+        return success, texts[0] if len(texts) == 1 else "\n".join(texts)
+
+    def parse_value(self, text: str) -> Any:
+        """Parse tool output text as a Python literal (number, list, bool), falling back to the raw string"""
+        try:
+            return ast.literal_eval(text.strip())
+        except Exception:
+            return text.strip()
+
+    def find_result_handle(self, text: str) -> Optional[str]:
+        """Find the result:// handle of a large result that was stored server-side"""
+        match = RESULT_HANDLE_PATTERN.search(text)
+        return match.group(0) if match else None
+
     def validate_user_preferences(self, preferences: dict) -> bool:
         """
         Validates that user preferences contain required fields
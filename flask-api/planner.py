@@ -0,0 +1,251 @@
+import asyncio
+import json
+import logging
+import re
+from typing import AbstractSet, Any, Dict, Optional, Set, Tuple
+
+from catalog import ToolCatalog, handle_params
+from deadline import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+# A step argument of the form "$<step_id>" is replaced by that step's result
+REF_PATTERN = re.compile(r"^\$([A-Za-z_][A-Za-z0-9_]*)$")
+
+# Tools that are useless inside a precomputed plan
+EXCLUDED_TOOLS = {"show_reasoning", "verify_calculation", "verify_consistency"}
+
+PLAN_PROMPT_TEMPLATE = """You are a math agent. Solve the expression by producing a complete plan of tool calls.
+
+Tools:
+{catalog}
+
+Respond with ONLY a JSON object (no markdown) of the form:
+{{"steps": [{{"id": "s1", "tool": "<tool name>", "args": {{...}}}}, ...], "result": "$<step id>"}}
+
+Rules:
+- "args" nests the dotted parameter names: input.a and input.b become {{"input": {{"a": ..., "b": ...}}}}.
+- To use the result of an earlier step as an argument, write "$<step id>" as the whole value, e.g. "$s1".
+- Apply BODMAS: every operation is its own step; steps that do not depend on each other run in parallel.
+- "result" references the step whose value is the final answer.
+
+Example for (2 + 3) * (4 - 1):
+{{"steps": [{{"id": "s1", "tool": "add", "args": {{"input": {{"a": 2, "b": 3}}}}}}, {{"id": "s2", "tool": "subtract", "args": {{"input": {{"a": 4, "b": 1}}}}}}, {{"id": "s3", "tool": "multiply", "args": {{"input": {{"a": "$s1", "b": "$s2"}}}}}}], "result": "$s3"}}"""
+
+class PlanError(Exception):
+    """Raised when a plan cannot be parsed or one of its steps fails"""
+
+class PlanStep:
+    def __init__(self, step_id: str, tool: str, args: Dict[str, Any]):
+        self.id = step_id
+        self.tool = tool
+        self.args = args
+        self.depends_on: Set[str] = find_refs(args)
+
+def find_refs(value: Any, skip: AbstractSet[str] = frozenset(), path: str = "") -> Set[str]:
+    """
+    Collect the step ids referenced anywhere inside a (nested) argument value.
+    References at the dotted paths in `skip` are left out.
+    """
+    if isinstance(value, str):
+        match = REF_PATTERN.match(value.strip())
+        return {match.group(1)} if match and path not in skip else set()
+    if isinstance(value, dict):
+        return set().union(*(find_refs(v, skip, f"{path}.{k}" if path else k) for k, v in value.items())) if value else set()
+    if isinstance(value, list):
+        return set().union(*(find_refs(v, skip, f"{path}[]") for v in value)) if value else set()
+    return set()
+
+def resolve_refs(
+    value: Any,
+    results: Dict[str, Any],
+    handles: Optional[Dict[str, str]] = None,
+    accepts: AbstractSet[str] = frozenset(),
+    path: str = ""
+) -> Any:
+    """
+    Replace "$<step_id>" references with the results of earlier steps.
+    At the dotted paths in `accepts`, results stored server-side are passed by their result:// handle.
+    """
+    if isinstance(value, str):
+        match = REF_PATTERN.match(value.strip())
+        if not match:
+            return value
+        if handles and path in accepts and match.group(1) in handles:
+            return handles[match.group(1)]
+        return results[match.group(1)]
+    if isinstance(value, dict):
+        return {k: resolve_refs(v, results, handles, accepts, f"{path}.{k}" if path else k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [resolve_refs(v, results, handles, accepts, f"{path}[]") for v in value]
+    return value
+
+class PlanExecutor:
+    """
+    Plan-then-execute mode: the LLM returns the whole solution once as a
+    dependency graph of tool calls, which is then executed locally with
+    independent branches running concurrently. The LLM is only consulted
+    again to re-plan after a failure.
+    """
+    def __init__(self, catalog: Optional[ToolCatalog] = None, max_replans: int = 2):
+        self.catalog = catalog or ToolCatalog()
+        self.max_replans = max_replans
+
+    def build_prompt(self, expression: str, tools: Any, failure: Optional[str] = None) -> str:
+        """Build the planning prompt, including the previous failure when re-planning"""
+        prefix = self.catalog.render(tools, exclude=EXCLUDED_TOOLS, template=PLAN_PROMPT_TEMPLATE)
+        prompt = f"{prefix}\n\nExpression: {expression}"
+        if failure:
+            prompt += f"\n\nThe previous plan failed: {failure}\nReturn a corrected complete plan."
+        return prompt
+
+    def parse_plan(self, text: str, tools: Any) -> Tuple[Dict[str, PlanStep], str]:
+        """
+        Parse and validate the LLM's JSON plan
+        Returns: (steps by id, id of the result step)
+        """
+        start, end = text.find("{"), text.rfind("}")
+        if start == -1 or end == -1:
+            raise PlanError("Plan is not a JSON object")
+        try:
+            plan = json.loads(text[start:end + 1])
+        except ValueError as e:
+            raise PlanError(f"Plan is not valid JSON: {e}")
+        if not isinstance(plan, dict) or not isinstance(plan.get("steps", []), list):
+            raise PlanError('Plan must be an object with a "steps" list')
+
+        tool_names = {getattr(t, 'name', '') for t in tools}
+        steps: Dict[str, PlanStep] = {}
+        for raw in plan.get("steps", []):
+            if not isinstance(raw, dict):
+                raise PlanError(f"Plan step is not an object: {raw!r}")
+            step_id, tool, args = raw.get("id", ""), raw.get("tool", ""), raw.get("args", {})
+            if not isinstance(step_id, str) or not isinstance(tool, str) or not isinstance(args, dict):
+                raise PlanError(f'Plan step needs string "id" and "tool" and an object "args": {raw!r}')
+            step = PlanStep(step_id, tool, args)
+            if not step.id or step.id in steps:
+                raise PlanError(f"Missing or duplicate step id: {step.id!r}")
+            if step.tool not in tool_names:
+                raise PlanError(f"Step {step.id} uses unknown tool: {step.tool}")
+            steps[step.id] = step
+        if not steps:
+            raise PlanError("Plan has no steps")
+
+        for step in steps.values():
+            unknown = step.depends_on - steps.keys()
+            if unknown:
+                raise PlanError(f"Step {step.id} references unknown steps: {sorted(unknown)}")
+
+        result_refs = find_refs(plan.get("result", ""))
+        if len(result_refs) != 1 or not result_refs <= steps.keys():
+            raise PlanError(f"Invalid plan result reference: {plan.get('result')!r}")
+        return steps, result_refs.pop()
+
+    async def execute(
+        self,
+        steps: Dict[str, PlanStep],
+        memory_layer: Any,
+        perception_layer: Any,
+        results: Optional[Dict[str, Any]] = None,
+        action_layer: Any = None
+    ) -> Dict[str, Any]:
+        """
+        Execute the plan, running every step as soon as its dependencies are done.
+        Completed step results are collected into `results` (so they survive a deadline).
+        Large results stored server-side are passed on by handle to parameters that
+        accept one (e.g. list inputs), and only fetched when a later step needs the value.
+        """
+        session = memory_layer.get_mcp_session()
+        deadline = memory_layer.get_deadline()
+        results = {} if results is None else results
+        handles: Dict[str, str] = {}
+        tools = {getattr(t, 'name', ''): t for t in memory_layer.get_tools() or []}
+        accepts = {name: handle_params(tools[name]) for name in {s.tool for s in steps.values()} if name in tools}
+        needed = set().union(*(find_refs(step.args, accepts.get(step.tool, set())) for step in steps.values()))
+        pending = dict(steps)
+        running: Dict[asyncio.Task, str] = {}
+
+        async def run_step(step: PlanStep) -> Any:
+            args = resolve_refs(step.args, results, handles, accepts.get(step.tool, set()))
+            try:
+                if deadline:
+                    result = await deadline.run(session.call_tool(step.tool, args))
+                else:
+                    result = await session.call_tool(step.tool, args)
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                raise PlanError(f"Step {step.id} ({step.tool} {json.dumps(args)}) failed: {e}")
+            success, text = perception_layer.parse_tool_result(result)
+            if not success or text.startswith("Error"):
+                raise PlanError(f"Step {step.id} ({step.tool} {json.dumps(args)}) failed: {text}")
+            memory_layer.add_step(step.tool, args, text)
+            handle = perception_layer.find_result_handle(text)
+            if handle:
+                handles[step.id] = handle
+                if step.id in needed and action_layer:
+                    text = await action_layer.read_large_result(session, handle, deadline)
+            return perception_layer.parse_value(text)
+
+        try:
+            while pending or running:
+                ready = [s for s in pending.values() if s.depends_on <= results.keys()]
+                for step in ready:
+                    del pending[step.id]
+                    running[asyncio.create_task(run_step(step))] = step.id
+                if not running:
+                    raise PlanError(f"Plan has circular dependencies between steps: {sorted(pending)}")
+
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    step_id = running.pop(task)
+                    results[step_id] = task.result()
+        finally:
+            for task in running:
+                task.cancel()
+
+        return results
+
+    async def run(
+        self,
+        expression: str,
+        memory_layer: Any,
+        perception_layer: Any,
+        action_layer: Any
+    ) -> Dict[str, Any]:
+        """Plan with one LLM call, execute locally, and re-plan only on failure"""
+        tools = memory_layer.get_tools()
+        deadline = memory_layer.get_deadline()
+        failure = None
+        llm_calls = 0
+        results: Dict[str, Any] = {}
+
+        try:
+            for attempt in range(self.max_replans + 1):
+                prompt = self.build_prompt(expression, tools, failure)
+                # Re-plans go to the stronger model
+                response_text = await action_layer.generate(
+                    prompt, deadline, escalate=failure is not None, memory_layer=memory_layer
+                )
+                llm_calls += 1
+                try:
+                    steps, result_id = self.parse_plan(response_text, tools)
+                    logger.info(f"Executing plan with {len(steps)} steps (attempt {attempt + 1})")
+                    results = {}
+                    await self.execute(steps, memory_layer, perception_layer, results, action_layer)
+                    action_layer.report_outcome(memory_layer, True)
+                    return {
+                        "result": str(results[result_id]),
+                        "llm_calls": llm_calls,
+                        "steps": len(steps)
+                    }
+                except PlanError as e:
+                    action_layer.report_outcome(memory_layer, False)
+                    logger.warning(f"Plan attempt {attempt + 1} failed: {e}")
+                    failure = str(e)
+        except DeadlineExceeded as e:
+            # Return the latest completed step as the best partial result
+            partial = str(list(results.values())[-1]) if results else "No result found"
+            return {"result": partial, "partial": True, "error": str(e)}
+
+        return {"error": f"Planning failed after {llm_calls} attempts: {failure}"}
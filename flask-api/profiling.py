@@ -0,0 +1,121 @@
+"""
+On-demand profiling for live processes.
+
+A Profiler is armed for the next N requests (or tool calls). Each profiled
+request produces a cProfile trace (.prof plus a text summary) and a
+tracemalloc allocation report in PROFILE_DIR. When nothing is armed the only
+cost per request is one integer comparison.
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Awaitable, Dict, Iterator, List
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"))
+TOP_ENTRIES = 40
+
+logger = logging.getLogger(__name__)
+
+# cProfile hooks and tracemalloc are process-wide, so only one profile runs at a time
+_active = threading.Lock()
+
+class Profiler:
+    def __init__(self, name: str, output_dir: str = PROFILE_DIR):
+        self.name = name
+        self.output_dir = output_dir
+        self.remaining = 0
+        self.lock = threading.Lock()
+
+    def arm(self, count: int) -> None:
+        """
+        Profile the next `count` requests.
+        Lock-free (a single assignment) so it is safe to call from a signal handler,
+        which may interrupt a thread holding self.lock.
+        """
+        self.remaining = max(0, count)
+
+    def should_profile(self, force: bool = False) -> bool:
+        """Check (and consume) whether the current request should be profiled"""
+        if not force and self.remaining <= 0:
+            return False
+        with self.lock:
+            if force:
+                return True
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+    @contextmanager
+    def profile(self, label: str) -> Iterator[None]:
+        """
+        Profile the enclosed block and write the artifacts.
+        cProfile traces the current thread, so on an event loop it also sees
+        other tasks that run while the profiled one awaits. A block that starts
+        while another profile is running is run without profiling.
+        """
+        if not _active.acquire(blocking=False):
+            logger.info(f"Profiler busy, not profiling {label}")
+            yield
+            return
+        try:
+            yield from self._profile(label)
+        finally:
+            _active.release()
+
+    def _profile(self, label: str) -> Iterator[None]:
+        profiler = cProfile.Profile()
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(25)
+        started = time.time()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            snapshot = tracemalloc.take_snapshot()
+            if started_tracing:
+                tracemalloc.stop()
+            self._write_artifacts(label, started, profiler, snapshot)
+
+    async def profile_coroutine(self, awaitable: Awaitable[Any], label: str) -> Any:
+        """Await a coroutine under the profiler"""
+        with self.profile(label):
+            return await awaitable
+
+    def _write_artifacts(self, label: str, started: float, profiler: cProfile.Profile, snapshot: tracemalloc.Snapshot) -> None:
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(started)) + f"-{int(started * 1000) % 1000:03d}"
+        safe_label = re.sub(r"[^A-Za-z0-9_.-]", "_", label)[:40]
+        base = os.path.join(self.output_dir, f"{self.name}-{stamp}-{safe_label}")
+
+        profiler.dump_stats(f"{base}.prof")
+
+        summary = io.StringIO()
+        stats = pstats.Stats(profiler, stream=summary)
+        stats.sort_stats("cumulative").print_stats(TOP_ENTRIES)
+        with open(f"{base}-cpu.txt", "w") as f:
+            f.write(f"{label}: {time.time() - started:.3f}s wall\n")
+            f.write(summary.getvalue())
+
+        with open(f"{base}-alloc.txt", "w") as f:
+            for stat in snapshot.statistics("lineno")[:TOP_ENTRIES]:
+                f.write(f"{stat}\n")
+
+    def list_artifacts(self) -> List[Dict[str, Any]]:
+        """Artifacts in the output directory, newest first"""
+        if not os.path.isdir(self.output_dir):
+            return []
+        names = sorted(os.listdir(self.output_dir), reverse=True)
+        return [
+            {"name": name, "bytes": os.path.getsize(os.path.join(self.output_dir, name))}
+            for name in names if name.endswith((".prof", ".txt"))
+        ]
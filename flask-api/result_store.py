@@ -0,0 +1,97 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Results longer than this are stored server-side and returned as a result:// handle
+LARGE_RESULT_CHARS = int(os.getenv("LARGE_RESULT_CHARS", "4096"))
+PREVIEW_CHARS = 200
+HANDLE_PREFIX = "result://"
+
+def strip_prefix(result_id: str) -> str:
+    """Result id of a full handle"""
+    return result_id[len(HANDLE_PREFIX):] if result_id.startswith(HANDLE_PREFIX) else result_id
+
+class ResultStore:
+    """
+    Bounded LRU store of large tool results.
+    Each result is addressed by a content hash handle (result://<id>) and is
+    read back in ranges through the result:// MCP resources, so neither side
+    has to move the whole payload in one message. Numeric list results also
+    keep their decoded array, so tools taking a handle as list input skip
+    parsing the text.
+    """
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_entries: int = 256):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, str]" = OrderedDict()
+        self.arrays: Dict[str, Any] = {}
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    def put(self, data: str, array: Any = None) -> str:
+        """Store a result (and optionally its numeric array) and return its handle"""
+        result_id = hashlib.sha1(data.encode()).hexdigest()[:16]
+        with self.lock:
+            if result_id in self.entries:
+                self.entries.move_to_end(result_id)
+            else:
+                self.entries[result_id] = data
+                self.total_bytes += len(data)
+            if array is not None and result_id not in self.arrays:
+                self.arrays[result_id] = array
+                self.total_bytes += array.nbytes
+            while len(self.entries) > 1 and (
+                len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes
+            ):
+                evicted_id, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= len(evicted)
+                evicted_array = self.arrays.pop(evicted_id, None)
+                if evicted_array is not None:
+                    self.total_bytes -= evicted_array.nbytes
+        return f"{HANDLE_PREFIX}{result_id}"
+
+    def get(self, result_id: str) -> Optional[str]:
+        """Get a stored result by id (or full handle)"""
+        result_id = strip_prefix(result_id)
+        with self.lock:
+            data = self.entries.get(result_id)
+            if data is not None:
+                self.entries.move_to_end(result_id)
+            return data
+
+    def get_array(self, result_id: str) -> Any:
+        """Get the numeric array of a stored result, or None if it was stored as text only"""
+        result_id = strip_prefix(result_id)
+        with self.lock:
+            if result_id not in self.entries:
+                raise KeyError(f"Unknown or expired result: {HANDLE_PREFIX}{result_id}")
+            self.entries.move_to_end(result_id)
+            return self.arrays.get(result_id)
+
+    def read(self, result_id: str, offset: int, length: int) -> str:
+        """Read a range of a stored result"""
+        data = self.get(result_id)
+        if data is None:
+            raise KeyError(f"Unknown or expired result: {result_id}")
+        return data[offset:offset + length]
+
+    def info(self, result_id: str) -> Dict[str, Any]:
+        """Size and preview of a stored result"""
+        data = self.get(result_id)
+        if data is None:
+            raise KeyError(f"Unknown or expired result: {result_id}")
+        return {"size": len(data), "preview": data[:PREVIEW_CHARS]}
+
+def summarize(text: str, handle: str, list_input: bool = False) -> str:
+    """
+    Short text the LLM sees instead of a large result.
+    The model has no tool that reads resources, so it is only told how to pass the
+    handle on (list results can be given to list tools as input.l).
+    """
+    usage = f"; pass it to list tools as input.l={handle}" if list_input else ""
+    return f"{text[:PREVIEW_CHARS]}... [{len(text)} chars; full result stored at {handle}{usage}]"
+
+# Shared by all tools of the server process
+result_store = ResultStore()
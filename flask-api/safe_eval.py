@@ -0,0 +1,122 @@
+import ast
+import math
+import operator
+from typing import Any, Callable, Dict
+
+# Limits that keep a single evaluation cheap. Integer arithmetic is exact and
+# unbounded in Python, so integer results are capped at MAX_INT_BITS; float
+# results overflow quickly on their own.
+MAX_EXPONENT = 10000
+MAX_FACTORIAL = 1000
+MAX_INT_BITS = 10000
+MAX_ROUND_DIGITS = 100
+
+def _check_bits(bits: float) -> None:
+    if bits > MAX_INT_BITS:
+        raise ValueError(f"Result too large (about {int(bits)} bits)")
+
+def _power(a: float, b: float) -> float:
+    if abs(b) > MAX_EXPONENT:
+        raise ValueError(f"Exponent too large: {b}")
+    if isinstance(a, int) and isinstance(b, int) and b > 0 and abs(a) > 1:
+        _check_bits(b * math.log2(abs(a)))
+    return operator.pow(a, b)
+
+def _multiply(a: float, b: float) -> float:
+    if isinstance(a, int) and isinstance(b, int):
+        _check_bits(a.bit_length() + b.bit_length())
+    return operator.mul(a, b)
+
+def _round(a: float, ndigits: Any = None) -> float:
+    # round(int, -n) computes 10 ** n internally
+    if ndigits is not None and abs(ndigits) > MAX_ROUND_DIGITS:
+        raise ValueError(f"Unsupported number of digits: {ndigits}")
+    return round(a, ndigits)
+
+def _factorial(a: float) -> int:
+    if a != int(a) or a < 0 or a > MAX_FACTORIAL:
+        raise ValueError(f"Unsupported factorial argument: {a}")
+    return math.factorial(int(a))
+
+BINARY_OPERATORS: Dict[type, Callable[[Any, Any], Any]] = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: _multiply,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: _power,
+}
+
+UNARY_OPERATORS: Dict[type, Callable[[Any], Any]] = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+FUNCTIONS: Dict[str, Callable[..., Any]] = {
+    "abs": abs,
+    "round": _round,
+    "pow": _power,
+    "sqrt": math.sqrt,
+    "cbrt": lambda a: a ** (1 / 3),
+    "exp": math.exp,
+    "log": math.log,
+    "log10": math.log10,
+    "sin": math.sin,
+    "cos": math.cos,
+    "tan": math.tan,
+    "factorial": _factorial,
+}
+
+CONSTANTS: Dict[str, float] = {
+    "pi": math.pi,
+    "e": math.e,
+}
+
+def safe_eval(expression: str) -> float:
+    """
+    Evaluate an arithmetic expression without `eval`.
+    Supports numbers, + - * / // % **, parentheses, the functions in FUNCTIONS
+    (also as math.<name>) and the constants pi and e. Raises ValueError otherwise.
+    """
+    try:
+        tree = ast.parse(expression.strip().replace("^", "**"), mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"Invalid expression: {expression}") from e
+    return _eval_node(tree.body)
+
+def _eval_node(node: ast.AST) -> Any:
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return node.value
+    if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+        return BINARY_OPERATORS[type(node.op)](_eval_node(node.left), _eval_node(node.right))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPERATORS:
+        return UNARY_OPERATORS[type(node.op)](_eval_node(node.operand))
+    if isinstance(node, ast.Name) and node.id in CONSTANTS:
+        return CONSTANTS[node.id]
+    if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == "math":
+        if node.attr in CONSTANTS:
+            return CONSTANTS[node.attr]
+    if isinstance(node, ast.Call) and not node.keywords:
+        name = _function_name(node.func)
+        if name in FUNCTIONS:
+            return FUNCTIONS[name](*(_eval_node(arg) for arg in node.args))
+    raise ValueError(f"Unsupported expression element: {ast.dump(node)}")
+
+def _function_name(node: ast.AST) -> str:
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == "math":
+        return node.attr
+    return ""
+
+def is_close(actual: Any, expected: Any, tolerance: float = 1e-9) -> bool:
+    """Compare numbers (or lists of numbers) with a relative/absolute tolerance"""
+    if isinstance(actual, (list, tuple)) or isinstance(expected, (list, tuple)):
+        if not isinstance(actual, (list, tuple)) or not isinstance(expected, (list, tuple)):
+            return False
+        return len(actual) == len(expected) and all(is_close(a, b, tolerance) for a, b in zip(actual, expected))
+    try:
+        return math.isclose(float(actual), float(expected), rel_tol=tolerance, abs_tol=tolerance)
+    except (TypeError, ValueError, OverflowError):
+        return False
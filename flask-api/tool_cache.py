@@ -0,0 +1,120 @@
+import functools
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+class ToolResultCache:
+    """
+    Bounded LRU cache of tool results.
+    Eviction is size-aware: the cache holds at most `max_entries` results and
+    `max_bytes` of serialized output, and results above `max_entry_bytes` are
+    never cached.
+    """
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 8 * 1024 * 1024, max_entry_bytes: int = 256 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.entries: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """Look up a result. Returns: (found, result)"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[0]
+
+    def put(self, key: str, value: Any, size: int) -> None:
+        """Store a result, evicting least recently used entries to stay within bounds"""
+        if size > self.max_entry_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size)
+            self.total_bytes += size
+            while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+# Shared by every tool declared with @pure
+tool_cache = ToolResultCache()
+
+def _canonical(value: Any) -> Any:
+    """Convert tool arguments (pydantic models included) into JSON-ready values"""
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json")
+    return value
+
+# Inputs longer than this (e.g. packed arrays) are keyed by their hash
+MAX_RAW_KEY_CHARS = 256
+
+def make_key(name: str, args: tuple, kwargs: dict) -> str:
+    """Cache key: the tool name plus its canonicalized (sorted, compact JSON) input"""
+    payload = {
+        "args": [_canonical(a) for a in args],
+        "kwargs": {k: _canonical(v) for k, v in kwargs.items()},
+    }
+    raw = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    if len(raw) > MAX_RAW_KEY_CHARS:
+        raw = hashlib.sha256(raw.encode()).hexdigest()
+    return f"{name}:{raw}"
+
+def result_size(result: Any) -> int:
+    """Approximate memory footprint of a result by its serialized size"""
+    if hasattr(result, "model_dump_json"):
+        return len(result.model_dump_json())
+    return len(str(result))
+
+def pure(func: Optional[Callable] = None, *, cache: Optional[ToolResultCache] = None) -> Callable:
+    """
+    Declare a tool as a pure function of its input so its results are memoized.
+    Apply it below @mcp.tool(). Failed results (success=False) and results
+    stored by handle are not cached.
+    """
+    def decorator(fn: Callable) -> Callable:
+        result_cache = cache or tool_cache
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = make_key(fn.__name__, args, kwargs)
+            found, result = result_cache.get(key)
+            if found:
+                return result
+            result = fn(*args, **kwargs)
+            # Large results live in the result store, which may evict them independently
+            if getattr(result, "success", True) and not getattr(result, "handle", None):
+                result_cache.put(key, result, result_size(result))
+            return result
+
+        wrapper.is_pure = True
+        return wrapper
+
+    return decorator(func) if func is not None else decorator